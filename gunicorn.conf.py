@@ -0,0 +1,12 @@
+# Gunicorn settings for the Dash apps, e.g.
+#   gunicorn optimized-dash-app:server
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Import the app once in the master and fork workers from it, so the static
+# tables and arrays built at import are shared copy-on-write between workers
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gthread'
+threads = 8
@@ -2,19 +2,28 @@
 # coding: utf-8
 
 import os
+import hashlib
+from functools import lru_cache
+from flask import request
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
+from dash import dcc, html, Input, Output, State, Patch, ctx, no_update
 import plotly.graph_objects as go
-import pandas as pd
-import json
+import plotly.io as pio
 import numpy as np
 
 # ---------------------------
 # Initialize Dash App
 # ---------------------------
-app = dash.Dash(__name__, suppress_callback_exceptions=True)
-server = app.server  # Important for gunicorn deployment
+# compress=True gzips responses via flask-compress; plotly's orjson engine
+# encodes the numpy-backed figure arrays much faster than stdlib json
+app = dash.Dash(__name__, suppress_callback_exceptions=True, compress=True)
+server = app.server  # Important for gunicorn deployment (see gunicorn.conf.py)
+pio.json.config.default_engine = 'orjson'
+
+# With a Mapbox token, use Mapbox's vector "light" style, whose tiles the
+# browser reuses across zoom levels; otherwise fall back to carto raster tiles
+mapbox_token = os.environ.get('MAPBOX_ACCESS_TOKEN')
+map_style = "light" if mapbox_token else "carto-positron"
 
 # ---------------------------
 # Create simplified Canadian provinces data without GeoJSON
@@ -54,87 +63,58 @@ province_to_places = {
     "Yukon": ["Kluane NP", "Miles Canyon", "SS Klondike", "Whitehorse", "Tombstone Park"]
 }
 
-# Create a DataFrame from our province centroids
-provinces_df = pd.DataFrame([
-    {"Province": province, "lat": data["lat"], "lon": data["lon"], 
-     "Notable Places": ", ".join(province_to_places.get(province, []))}
-    for province, data in province_centroids.items()
-])
-
-# Create a predefined dataset of notable places with coordinates
-notable_places_data = [
-    {"Province": "Alberta", "Place": "Banff NP", "lat": 51.1784, "lon": -115.5708},
-    {"Province": "Alberta", "Place": "Jasper NP", "lat": 52.8738, "lon": -117.9610},
-    {"Province": "Alberta", "Place": "Calgary Tower", "lat": 51.0447, "lon": -114.0719},
-    {"Province": "Alberta", "Place": "Lake Louise", "lat": 51.4254, "lon": -116.1773},
-    {"Province": "Alberta", "Place": "West Edmonton Mall", "lat": 53.5225, "lon": -113.6242},
-    {"Province": "British Columbia", "Place": "Stanley Park", "lat": 49.3017, "lon": -123.1417},
-    {"Province": "British Columbia", "Place": "Butchart Gardens", "lat": 48.5636, "lon": -123.4683},
-    {"Province": "British Columbia", "Place": "Whistler", "lat": 50.1163, "lon": -122.9574},
-    {"Province": "British Columbia", "Place": "Capilano Bridge", "lat": 49.3431, "lon": -123.1139},
-    {"Province": "British Columbia", "Place": "Pacific Rim NP", "lat": 49.0064, "lon": -125.6581},
-    {"Province": "Manitoba", "Place": "The Forks", "lat": 49.8865, "lon": -97.1307},
-    {"Province": "Manitoba", "Place": "Riding Mountain NP", "lat": 50.6625, "lon": -100.0333},
-    {"Province": "Manitoba", "Place": "Assiniboine Zoo", "lat": 49.8731, "lon": -97.2461},
-    {"Province": "Manitoba", "Place": "Museum for Human Rights", "lat": 49.8891, "lon": -97.1309},
-    {"Province": "Manitoba", "Place": "FortWhyte Alive", "lat": 49.8274, "lon": -97.2398},
-    {"Province": "New Brunswick", "Place": "Bay of Fundy", "lat": 45.2336, "lon": -66.1150},
-    {"Province": "New Brunswick", "Place": "Hopewell Rocks", "lat": 45.8261, "lon": -64.5706},
-    {"Province": "New Brunswick", "Place": "Fundy NP", "lat": 45.5960, "lon": -65.0018},
-    {"Province": "New Brunswick", "Place": "Reversing Falls", "lat": 45.2502, "lon": -66.0864},
-    {"Province": "New Brunswick", "Place": "Kings Landing", "lat": 45.9960, "lon": -66.9060},
-    {"Province": "Newfoundland and Labrador", "Place": "Gros Morne NP", "lat": 49.6022, "lon": -57.7564},
-    {"Province": "Newfoundland and Labrador", "Place": "Signal Hill", "lat": 47.5705, "lon": -52.6819},
-    {"Province": "Newfoundland and Labrador", "Place": "L'Anse aux Meadows", "lat": 51.5965, "lon": -55.5308},
-    {"Province": "Newfoundland and Labrador", "Place": "Cape Spear", "lat": 47.5227, "lon": -52.6173},
-    {"Province": "Newfoundland and Labrador", "Place": "Bonavista", "lat": 48.6583, "lon": -53.1127},
-    {"Province": "Nova Scotia", "Place": "Peggy's Cove", "lat": 44.4948, "lon": -63.9189},
-    {"Province": "Nova Scotia", "Place": "Cabot Trail", "lat": 46.7371, "lon": -60.3508},
-    {"Province": "Nova Scotia", "Place": "Halifax Citadel", "lat": 44.6478, "lon": -63.5816},
-    {"Province": "Nova Scotia", "Place": "Lunenburg", "lat": 44.3777, "lon": -64.3092},
-    {"Province": "Nova Scotia", "Place": "Kejimkujik NP", "lat": 44.3800, "lon": -65.2175},
-    {"Province": "Ontario", "Place": "CN Tower", "lat": 43.6426, "lon": -79.3871},
-    {"Province": "Ontario", "Place": "Niagara Falls", "lat": 43.0962, "lon": -79.0716},
-    {"Province": "Ontario", "Place": "Algonquin Park", "lat": 45.8333, "lon": -78.5000},
-    {"Province": "Ontario", "Place": "Parliament Hill", "lat": 45.4235, "lon": -75.7000},
-    {"Province": "Ontario", "Place": "Royal Ontario Museum", "lat": 43.6677, "lon": -79.3948},
-    {"Province": "Prince Edward Island", "Place": "Green Gables", "lat": 46.4911, "lon": -63.3838},
-    {"Province": "Prince Edward Island", "Place": "Cavindish Beach", "lat": 46.5011, "lon": -63.4187},
-    {"Province": "Prince Edward Island", "Place": "Confederation Trail", "lat": 46.3335, "lon": -63.3008},
-    {"Province": "Prince Edward Island", "Place": "PEI NP", "lat": 46.4127, "lon": -63.0878},
-    {"Province": "Prince Edward Island", "Place": "Point Prim Lighthouse", "lat": 46.0477, "lon": -62.9975},
-    {"Province": "Quebec", "Place": "Old Quebec", "lat": 46.8139, "lon": -71.2082},
-    {"Province": "Quebec", "Place": "Mont-Tremblant", "lat": 46.1184, "lon": -74.5958},
-    {"Province": "Quebec", "Place": "Montmorency Falls", "lat": 46.8855, "lon": -71.1510},
-    {"Province": "Quebec", "Place": "Quebec City", "lat": 46.8139, "lon": -71.2080},
-    {"Province": "Quebec", "Place": "Sainte-Anne-de-Beaupré", "lat": 47.0226, "lon": -70.9370},
-    {"Province": "Saskatchewan", "Place": "Forestry Zoo", "lat": 52.1316, "lon": -106.6702},
-    {"Province": "Saskatchewan", "Place": "Wanuskewin", "lat": 52.2163, "lon": -106.5931},
-    {"Province": "Saskatchewan", "Place": "Prince Albert NP", "lat": 53.9837, "lon": -106.0173},
-    {"Province": "Saskatchewan", "Place": "Wascana Centre", "lat": 50.4364, "lon": -104.6171},
-    {"Province": "Saskatchewan", "Place": "RCMP Heritage Centre", "lat": 50.4359, "lon": -104.6615},
-    {"Province": "Northwest Territories", "Place": "Nahanni NP", "lat": 61.5833, "lon": -125.5833},
-    {"Province": "Northwest Territories", "Place": "Great Slave Lake", "lat": 62.0955, "lon": -114.3858},
-    {"Province": "Northwest Territories", "Place": "Virginia Falls", "lat": 61.6031, "lon": -125.7744},
-    {"Province": "Northwest Territories", "Place": "Yellowknife", "lat": 62.4540, "lon": -114.3718},
-    {"Province": "Northwest Territories", "Place": "Wood Buffalo NP", "lat": 59.4675, "lon": -112.2124},
-    {"Province": "Nunavut", "Place": "Auyuittuq NP", "lat": 67.8333, "lon": -65.0000},
-    {"Province": "Nunavut", "Place": "Sylvia Grinnell Park", "lat": 63.7430, "lon": -68.5571},
-    {"Province": "Nunavut", "Place": "Qaummaarviit Park", "lat": 63.7942, "lon": -68.5532},
-    {"Province": "Nunavut", "Place": "Iqaluit", "lat": 63.7467, "lon": -68.5170},
-    {"Province": "Nunavut", "Place": "Sirmilik NP", "lat": 72.9962, "lon": -81.2503},
-    {"Province": "Yukon", "Place": "Kluane NP", "lat": 60.7500, "lon": -139.5000},
-    {"Province": "Yukon", "Place": "Miles Canyon", "lat": 60.6599, "lon": -135.0262},
-    {"Province": "Yukon", "Place": "SS Klondike", "lat": 60.7230, "lon": -135.0456},
-    {"Province": "Yukon", "Place": "Whitehorse", "lat": 60.7197, "lon": -135.0522},
-    {"Province": "Yukon", "Place": "Tombstone Park", "lat": 64.5167, "lon": -138.2167}
-]
+# Province columns as plain NumPy arrays; at 13 rows a DataFrame is pure overhead.
+# float32 keeps ~7 significant digits, far more than the 4-decimal source
+# coordinates need, and halves the bytes the map traces serialize
+province_names = np.array(list(province_centroids))
+province_lat = np.fromiter((data["lat"] for data in province_centroids.values()), dtype=np.float32)
+province_lon = np.fromiter((data["lon"] for data in province_centroids.values()), dtype=np.float32)
+province_hovertext = np.array([", ".join(province_to_places.get(province, [])) for province in province_centroids])
 
-# Create DataFrame from our predefined data
-notable_df = pd.DataFrame(notable_places_data)
+# Predefined notable places with coordinates, shipped as Province/Place/lat/lon
+# column arrays (float32 coordinates) so workers load them with one binary read
+# instead of executing a 65-row literal at import
+with np.load('canada_poi.npz') as notable_places_data:
+    _poi_province = notable_places_data["Province"]
+    poi_place = notable_places_data["Place"]
+    poi_lat = notable_places_data["lat"]
+    poi_lon = notable_places_data["lon"]
 
 # Generate unique marker IDs
-notable_df["marker_id"] = notable_df.apply(lambda row: f"{row['Province']}_{row['Place']}_{row.name}", axis=1)
+poi_marker_id = np.char.add(np.char.add(np.char.add(np.char.add(
+    _poi_province, "_"), poi_place), "_"), np.arange(len(poi_place)).astype(str))
+
+# Group the place rows by province (ids above keep the original row numbers)
+# so each province's markers are one contiguous slice of the column arrays
+_order = np.argsort(_poi_province, kind='stable')
+_poi_province, poi_place, poi_lat, poi_lon, poi_marker_id = (
+    arr[_order] for arr in (_poi_province, poi_place, poi_lat, poi_lon, poi_marker_id))
+_starts = np.searchsorted(_poi_province, province_names, side='left')
+_stops = np.searchsorted(_poi_province, province_names, side='right')
+province_to_slice = {p: slice(start, stop) for p, start, stop in zip(province_centroids, _starts, _stops)}
+
+# Per-province marker attributes and the map layout never change between callbacks
+province_sizes = np.full(len(province_names), 15)
+province_customdata = np.full(len(province_names), "")
+
+# Nothing writes to these after import; freezing them keeps the pages that
+# gunicorn's preloaded workers share copy-on-write from being touched
+for _arr in (poi_lat, poi_lon, poi_place, poi_marker_id, province_names,
+             province_lat, province_lon, province_hovertext, province_sizes,
+             province_customdata):
+    _arr.flags.writeable = False
+
+map_layout = dict(
+    mapbox=dict(
+        style=map_style,
+        accesstoken=mapbox_token,
+        zoom=2,
+        center={"lat": 56.130, "lon": -106.347},
+    ),
+    margin={"r": 0, "t": 0, "l": 0, "b": 0},
+    showlegend=False,
+    uirevision='constant'  # Preserves zoom/pan state on updates
+)
 
 # ---------------------------
 # App Layout
@@ -145,7 +125,7 @@ app.layout = html.Div([
         html.Label("Select provinces to explore:"),
         dcc.Dropdown(
             id='province-dropdown',
-            options=[{'label': prov, 'value': prov} for prov in sorted(provinces_df['Province'].unique())],
+            options=[{'label': prov, 'value': prov} for prov in sorted(province_names)],
             multi=True,
             placeholder="Select provinces to highlight on map",
             style={'width': '100%'}
@@ -163,66 +143,71 @@ app.layout = html.Div([
                  children="Click on markers to see more information.", 
                  style={'textAlign': 'center', 'marginBottom': '10px'}),
     ], style={'margin': '0 auto', 'width': '80%', 'marginTop': '20px'}),
-    dcc.Store(id='clicked-markers', data=[])
+    dcc.Store(id='clicked-markers', data={})
 ])
 
 # ---------------------------
 # Callbacks
 # ---------------------------
-@app.callback(
+# Info text is pure string formatting, so it is rendered in the browser
+# instead of costing a server round-trip per interaction
+app.clientside_callback(
+    """
+    function(selected) {
+        if (!selected || selected.length === 0) {
+            return "Select provinces above to see their notable places.";
+        }
+        return "Selected provinces: " + selected.join(", ");
+    }
+    """,
     Output('selection-info', 'children'),
     Input('province-dropdown', 'value')
 )
-def update_selection_info(selected_provinces):
-    """Update text showing what's currently selected"""
-    if not selected_provinces or len(selected_provinces) == 0:
-        return "Select provinces above to see their notable places."
-    return f"Selected provinces: {', '.join(selected_provinces)}"
 
-@app.callback(
+# Toggling a marker is plain object bookkeeping, so the store update and its
+# info text both happen in the browser; update_map is the only server work
+app.clientside_callback(
+    """
+    function(clickData, clicked) {
+        var noUpdate = window.dash_clientside.no_update;
+        var point = clickData && clickData.points ? clickData.points[0] : null;
+        if (!point) {
+            // Nothing was hit, so leave the store alone and skip update_map
+            return [noUpdate, noUpdate];
+        }
+        var current = Object.assign({}, clicked || {});
+        var store = noUpdate;
+        var info = "Click on markers to see more information.";
+        if (point.customdata) {
+            var markerId = point.customdata;
+            var placeName = point.hovertext || "";
+            // Clicked markers are kept as a marker_id -> place object for O(1) toggling
+            if (markerId in current) {
+                // Toggle off if clicked again
+                delete current[markerId];
+                info = "Deselected place: " + placeName;
+            } else {
+                current[markerId] = placeName;
+                info = "Selected place: " + placeName;
+            }
+            store = current;
+        } else if (point.text) {
+            // Province was clicked
+            info = "Province: " + point.text;
+        }
+        // The store already maps marker_id -> place name, so no id parsing
+        var places = Object.values(current);
+        if (places.length) {
+            info = "Selected places: " + places.join(", ");
+        }
+        return [store, info];
+    }
+    """,
     Output('clicked-markers', 'data'),
     Output('clicked-info', 'children'),
     Input('map', 'clickData'),
     State('clicked-markers', 'data')
 )
-def update_clicked_markers(clickData, current_clicked):
-    if not current_clicked:
-        current_clicked = []
-        
-    info_text = "Click on markers to see more information."
-    
-    if clickData and 'points' in clickData:
-        point = clickData['points'][0]
-        if 'customdata' in point:
-            marker_id = point['customdata']
-            place_name = point.get('text', '')
-            
-            if marker_id not in current_clicked:
-                current_clicked.append(marker_id)
-                info_text = f"Selected place: {place_name}"
-            else:
-                # Toggle off if clicked again
-                current_clicked = [m for m in current_clicked if m != marker_id]
-                info_text = f"Deselected place: {place_name}"
-                
-        elif 'text' in point:
-            # Province was clicked
-            province_name = point.get('text', '')
-            info_text = f"Province: {province_name}"
-            
-    if current_clicked:
-        # Get all place names for clicked markers
-        clicked_places = []
-        for marker_id in current_clicked:
-            parts = marker_id.split('_')
-            if len(parts) >= 2:
-                place = parts[1]
-                clicked_places.append(place)
-        
-        if clicked_places:
-            info_text = f"Selected places: {', '.join(clicked_places)}"
-    
-    return current_clicked, info_text
 
 @app.callback(
     Output('map', 'figure'),
@@ -230,64 +215,84 @@ def update_clicked_markers(clickData, current_clicked):
     Input('clicked-markers', 'data')
 )
 def update_map(selected_provinces, clicked_markers):
-    # Handle None or empty selections
-    if not selected_provinces:
-        selected_provinces = []
+    # Handle None or empty selections; tuples are hashable cache keys
+    selected_provinces = tuple(sorted(selected_provinces or ()))
+    clicked_markers = clicked_markers or {}
     
-    if not clicked_markers:
-        clicked_markers = []
+    # A marker click only changes marker colours, so patch those in place
+    # instead of resending the whole figure
+    if ctx.triggered_id == 'clicked-markers':
+        idx = marker_indices(selected_provinces)
+        if not idx.size:
+            return no_update
+        patch = Patch()
+        selected_mask = np.isin(province_names, selected_provinces)
+        patch['data'][0]['marker']['color'] = point_colors(selected_mask, idx, clicked_markers)
+        return patch
     
+    return build_map_figure(selected_provinces, tuple(sorted(clicked_markers)))
+
+@lru_cache(maxsize=256)
+def marker_indices(selected_provinces):
+    """Row indices of the notable places in the selected provinces, cached
+    per selection since the same few tuples recur across callbacks"""
+    if not selected_provinces:
+        idx = np.empty(0, dtype=np.intp)
+    else:
+        idx = np.r_[tuple(province_to_slice[p] for p in selected_provinces)]
+    idx.flags.writeable = False  # Shared by every caller through the cache
+    return idx
+
+def marker_colors(idx, clicked_markers):
+    """Green for clicked markers, red for the rest"""
+    return np.where(np.isin(poi_marker_id[idx], list(clicked_markers)), "#33cc33", "#ff3333")
+
+def point_colors(selected_mask, idx, clicked_markers):
+    """Colours for the combined trace: provinces first, then their places"""
+    return np.concatenate([np.where(selected_mask, '#3366cc', '#cccccc'), marker_colors(idx, clicked_markers)])
+
+@lru_cache(maxsize=256)
+def build_map_figure(selected_provinces, clicked_markers):
+    """Build the map for a (selection, clicked) state, cached as a plain dict
+    so repeated states skip both figure construction and the Figure->dict walk"""
     # Create base map figure
-    fig = go.Figure()
+    fig = go.Figure(layout=map_layout)
     
-    # Add text labels for all provinces
+    # Province labels and the notable places in selected provinces share one
+    # trace: the province rows come first, followed by the place markers.
+    # Only places carry a marker_id in customdata, which is how clicks tell them apart
+    idx = marker_indices(selected_provinces)
+    selected_mask = np.isin(province_names, selected_provinces)
     fig.add_trace(go.Scattermapbox(
-        lat=provinces_df["lat"],
-        lon=provinces_df["lon"],
+        lat=np.concatenate([province_lat, poi_lat[idx]]),
+        lon=np.concatenate([province_lon, poi_lon[idx]]),
         mode='text+markers',
         marker=dict(
-            size=15, 
-            color=['#3366cc' if p in selected_provinces else '#cccccc' for p in provinces_df['Province']],
-            opacity=[0.8 if p in selected_provinces else 0.5 for p in provinces_df['Province']]
+            size=np.concatenate([province_sizes, np.full(idx.size, 10)]),
+            color=point_colors(selected_mask, idx, clicked_markers),
+            opacity=np.concatenate([np.where(selected_mask, 0.8, 0.5), np.ones(idx.size)])
         ),
-        text=provinces_df["Province"],
+        text=np.concatenate([province_names, np.full(idx.size, "")]),
         textfont=dict(size=10, color='black'),
-        hovertext=provinces_df["Notable Places"],
-        hoverinfo='text',
-        name='Provinces'
+        # Each string goes out once: text labels provinces, hovertext is the
+        # tooltip (notable places for provinces, the name for places)
+        hovertext=np.concatenate([province_hovertext, poi_place[idx]]),
+        customdata=np.concatenate([province_customdata, poi_marker_id[idx]]),
+        hovertemplate='%{hovertext}<extra></extra>'
     ))
     
-    # Add markers for notable places in selected provinces
-    if selected_provinces:
-        marker_subset = notable_df[notable_df["Province"].isin(selected_provinces)]
-        if not marker_subset.empty:
-            marker_colors = ["#33cc33" if marker_id in clicked_markers else "#ff3333"
-                         for marker_id in marker_subset["marker_id"]]
-            
-            fig.add_trace(go.Scattermapbox(
-                lat=marker_subset["lat"],
-                lon=marker_subset["lon"],
-                mode='markers',
-                marker=dict(size=10, color=marker_colors),
-                text=marker_subset["Place"],
-                customdata=marker_subset["marker_id"],
-                hoverinfo='text',
-                name='Points of Interest'
-            ))
-    
-    # Update map layout
-    fig.update_layout(
-        mapbox=dict(
-            style="carto-positron",
-            zoom=2,
-            center={"lat": 56.130, "lon": -106.347},
-        ),
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        showlegend=False,
-        uirevision='constant'  # Preserves zoom/pan state on updates
-    )
-    
-    return fig
+    return fig.to_plotly_json()
+
+# The layout and callback graph are the same on every page load, so tag them
+# and let the browser revalidate with a 304 instead of re-downloading.
+# Callback responses are POSTs, which browsers never revalidate
+@server.after_request
+def add_etag(response):
+    if (request.method == 'GET' and response.status_code == 200
+            and request.path.endswith(('/_dash-layout', '/_dash-dependencies'))):
+        response.set_etag(hashlib.blake2b(response.get_data(), digest_size=8).hexdigest())
+        response.make_conditional(request)
+    return response
 
 # ---------------------------
 # Run the server
@@ -1,52 +1,110 @@
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
+from dash import dcc, html, Input, Output, State, Patch, ctx, no_update
 import plotly.graph_objects as go
-import json
+import plotly.io as pio
+import orjson
+import gzip
 import zipfile
 import os
+import hashlib
+from functools import lru_cache
+from urllib.parse import quote
+from flask import abort, make_response
 from flask_caching import Cache
 import pandas as pd
+import numpy as np
+import geopandas as gpd
+import shapely
 
 # ---------------------------
 # Initialize Dash App with Caching
 # ---------------------------
 app = dash.Dash(__name__)
 server = app.server  # For Render/Gunicorn deployment
+pio.json.config.default_engine = 'orjson'  # Serializes the NumPy trace arrays natively
 
-# Setup caching - simple RAM cache that will help with repeated operations
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300  # 5 minutes cache timeout
-})
+# Setup caching - a cache shared by all gunicorn workers, so the memoized
+# GeoJSON loader runs once per deploy instead of once per worker. Redis when
+# REDIS_URL is set, otherwise files under CACHE_DIR. Entries outlive a
+# process, so the loader's key includes the version of its source files
+cache_config = {
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.environ.get('CACHE_DIR', '/tmp/dash_cache'),
+    'CACHE_DEFAULT_TIMEOUT': 86400  # 1 day
+}
+if os.environ.get('REDIS_URL'):
+    cache_config.update({'CACHE_TYPE': 'RedisCache', 'CACHE_REDIS_URL': os.environ['REDIS_URL']})
+cache = Cache(app.server, config=cache_config)
 
 # ---------------------------
 # Data Loading Functions (Run once on startup)
 # ---------------------------
-@cache.memoize()
-def unzip_and_load_geojson(zip_path='data.zip', geojson_name='geoBoundaries-CAN-ADM1_simplified.geojson'):
-    """Unzip GeoJSON files and load data - cached for efficiency"""
+@lru_cache(maxsize=None)
+def open_zip(zip_path):
+    """Open an archive once and keep it open, so its central directory is
+    parsed a single time however many members are read"""
+    return zipfile.ZipFile(zip_path, 'r')
+
+# Simplification tolerance (degrees) per zoom tier; the client switches tiers
+# as the user zooms, so the continent view never pays for full detail
+GEOJSON_TIERS = {'low': 0.2, 'mid': 0.05, 'high': 0.01}
+
+def simplify_geojson(geojson_data, tolerance):
+    """Douglas-Peucker simplify every feature. Topology isn't preserved so
+    islands smaller than the tolerance collapse and drop out, which is where
+    nearly all of the Arctic archipelago's vertices are"""
+    gdf = gpd.GeoDataFrame.from_features(geojson_data['features'])
+    gdf['geometry'] = gdf['geometry'].simplify(tolerance, preserve_topology=False)
+    return orjson.loads(gdf.to_json())
+
+def source_version(*paths):
+    """(mtime, size) of each path, None for missing ones; changes whenever a
+    redeploy replaces the files"""
+    return tuple(
+        (os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+        for path in paths
+    )
+
+# Only successful loads are stored; a failure is retried by the next worker
+# rather than served to all of them
+@cache.memoize(response_filter=lambda result: result[2])
+def unzip_and_load_geojson(zip_path='data.zip', geojson_name='geoBoundaries-CAN-ADM1_simplified.geojson',
+                           tolerance=0.05, precomputed_name='provinces_simplified_mid.json.gz',
+                           version=None):
+    """Unzip GeoJSON files and load data - cached for efficiency. version is
+    only part of the cache key; pass source_version() of the input files"""
     try:
-        # Extract if needed
-        if not os.path.exists(geojson_name):
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall('.')
-            print(f"Extracted files from {zip_path}")
+        # Prefer the artifact shipped by precompute_geojson.py; unzipping and
+        # simplifying at startup is only a development fallback
+        if os.path.exists(precomputed_name):
+            with gzip.open(precomputed_name, 'rb') as f:
+                geojson_data = orjson.loads(f.read())
+        else:
+            # Read the GeoJSON member straight from the archive, without
+            # extracting everything in data.zip to the working directory
+            raw = open_zip(zip_path).read(geojson_name)
+        
+            # Pre-process: Simplify features to reduce payload size. The result is
+            # kept on disk under a hash of the source and tolerance, so the simplify
+            # runs once per input rather than once per process
+            digest = hashlib.blake2b(raw + repr(tolerance).encode(), digest_size=8).hexdigest()
+            simplified_name = f"{os.path.splitext(geojson_name)[0]}.{digest}.json"
+            if os.path.exists(simplified_name):
+                with open(simplified_name, 'rb') as f:
+                    geojson_data = orjson.loads(f.read())
+            else:
+                geojson_data = simplify_geojson(orjson.loads(raw), tolerance)
+                # Written under a per-process name and renamed into place, so workers
+                # starting together never read a half-written file
+                partial_name = f"{simplified_name}.{os.getpid()}.part"
+                with open(partial_name, 'wb') as f:
+                    f.write(orjson.dumps(geojson_data))
+                os.replace(partial_name, simplified_name)
         
-        # Load the GeoJSON file
-        with open(geojson_name) as f:
-            geojson_data = json.load(f)
-            
-        # Pre-process: Simplify features to reduce payload size
+        # Key features by province name so Plotly matches locations on the
+        # top-level id instead of resolving a featureidkey property path
         for feature in geojson_data['features']:
-            if 'geometry' in feature and feature['geometry'] and 'coordinates' in feature['geometry']:
-                # Simplify multipolygon coordinates (reduce detail for performance)
-                if feature['geometry']['type'] == 'MultiPolygon':
-                    feature['geometry']['coordinates'] = [[[coord for i, coord in enumerate(polygon[0]) if i % 3 == 0]] 
-                                                         for polygon in feature['geometry']['coordinates']]
-                elif feature['geometry']['type'] == 'Polygon':
-                    feature['geometry']['coordinates'] = [[coord for i, coord in enumerate(ring) if i % 3 == 0] 
-                                                         for ring in feature['geometry']['coordinates']]
+            feature['id'] = feature['properties']['shapeName']
         
         # Extract provinces list
         provinces = sorted([feature['properties']['shapeName'] for feature in geojson_data['features']])
@@ -59,8 +117,9 @@ def unzip_and_load_geojson(zip_path='data.zip', geojson_name='geoBoundaries-CAN-
         print(f"Error loading data: {e}")
         return None, [], False
 
-# Load POI data - structured as a pandas DataFrame for better processing
-@cache.memoize()
+# Load POI data - structured as a pandas DataFrame for better processing.
+# The data lives in this file, so a per-process cache can never go stale
+@lru_cache(maxsize=None)
 def load_poi_data():
     """Load Points of Interest data"""
     hardcoded_poi_coordinates = {
@@ -157,24 +216,124 @@ def load_poi_data():
         ]
     }
     
-    # Convert nested dictionary to flattened DataFrame for better performance
-    poi_rows = []
+    # Flatten the nested dictionary into one list per column, then build the
+    # DataFrame from those columns in a single call instead of from row dicts
+    provs, places, lats, lons, marker_ids = [], [], [], [], []
     for province, pois in hardcoded_poi_coordinates.items():
         for poi in pois:
-            poi_rows.append({
-                'province': province,
-                'place': poi['place'],
-                'lat': poi['lat'],
-                'lon': poi['lon'],
-                'marker_id': poi['marker_id']
-            })
+            provs.append(province)
+            places.append(poi['place'])
+            lats.append(poi['lat'])
+            lons.append(poi['lon'])
+            marker_ids.append(poi['marker_id'])
     
-    return pd.DataFrame(poi_rows)
+    return pd.DataFrame({
+        'province': pd.Categorical(provs),  # 13 values, stored as int8 codes
+        'place': places,
+        # float32 keeps ~7 significant digits, plenty for 4-decimal coordinates, in half the bytes
+        'lat': np.array(lats, dtype=np.float32),
+        'lon': np.array(lons, dtype=np.float32),
+        'marker_id': marker_ids
+    })
 
-# Load data at startup
-geojson_data, provinces, load_success = unzip_and_load_geojson()
+# Load data at startup: one simplified GeoJSON per zoom tier
+geojson_tiers = {}
+for tier, tolerance in GEOJSON_TIERS.items():
+    precomputed_name = f'provinces_simplified_{tier}.json.gz'
+    geojson_tiers[tier], provinces, load_success = unzip_and_load_geojson(
+        tolerance=tolerance, precomputed_name=precomputed_name,
+        version=source_version('data.zip', precomputed_name))
+    if not load_success:
+        break
 poi_df = load_poi_data()
 
+# Column arrays plus a province -> row-index lookup, built once so the map
+# callback gathers POIs with dict lookups instead of scanning poi_df
+poi_lat = poi_df['lat'].to_numpy()
+poi_lon = poi_df['lon'].to_numpy()
+poi_place = poi_df['place'].to_numpy()
+poi_marker_id = poi_df['marker_id'].to_numpy()
+poi_index_by_province = poi_df.groupby('province', observed=True).indices
+
+# ---------------------------
+# Province Shapes Served as Static GeoJSON
+# ---------------------------
+# The shapes never change, so instead of embedding the whole GeoJSON in every
+# figure the map references it by URL as Mapbox layers. The browser fetches
+# each file once and then reuses it from its HTTP cache
+GEOJSON_CACHE_SECONDS = 7 * 24 * 3600
+
+def _gzip_json(obj):
+    # Level 6 is ~5x faster than gzip's default 9 here for <1% larger output
+    return gzip.compress(orjson.dumps(obj), compresslevel=6, mtime=0)
+
+_geojson_gz = {}
+_label_points = {}
+if load_success:
+    for tier, tier_geojson in geojson_tiers.items():
+        _geojson_gz[tier, 'all'] = _gzip_json(tier_geojson)
+        for feature in tier_geojson['features']:
+            _geojson_gz[tier, feature['id']] = _gzip_json(feature)
+    features = geojson_tiers['high']['features']
+    # Layers aren't hoverable, so each province also gets an interior point for
+    # hover text; parsed and computed in bulk by shapely's vectorised functions
+    geometries = shapely.from_geojson([orjson.dumps(feature['geometry']) for feature in features])
+    _label_points = dict(zip((feature['id'] for feature in features), shapely.point_on_surface(geometries)))
+
+@server.route('/geojson/<tier>/<name>.json')
+def serve_geojson(tier, name):
+    """Pre-gzipped GeoJSON of one zoom tier for all provinces ('all') or a single province"""
+    body = _geojson_gz.get((tier, name))
+    if body is None:
+        abort(404)
+    response = make_response(body)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = f'public, max-age={GEOJSON_CACHE_SECONDS}'
+    return response
+
+def province_layer(name, color, opacity, tier):
+    """Mapbox fill layer drawing the GeoJSON served under /geojson/<tier>/<name>.json"""
+    return dict(
+        sourcetype='geojson',
+        source=app.get_relative_path(f'/geojson/{tier}/{quote(name)}.json'),
+        type='fill',
+        color=color,
+        opacity=opacity,
+        below='traces',
+    )
+
+def build_province_figure(layers, hover_provinces):
+    """Base map with the given province layers and hover points"""
+    points = [_label_points[prov] for prov in hover_provinces]
+    fig = go.Figure(go.Scattermapbox(
+        lat=[p.y for p in points],
+        lon=[p.x for p in points],
+        mode='markers',
+        marker=dict(size=20, opacity=0),
+        text=list(hover_provinces),
+        hoverinfo='text',
+    ))
+    fig.update_layout(
+        mapbox=dict(
+            style="carto-positron",
+            zoom=2,
+            center={"lat": 56.130, "lon": -106.347},
+            layers=layers,
+        ),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        showlegend=False,
+        uirevision='constant',  # Keep the user's zoom/pan when the tier or selection changes
+    )
+    return fig
+
+# The idle map (all provinces in light gray) never changes, so build it once
+# per tier as a plain dict at startup
+_DEFAULT_FIGURE_JSON = {
+    tier: build_province_figure([province_layer('all', 'lightgray', 0.5, tier)], provinces).to_plotly_json()
+    for tier in GEOJSON_TIERS
+} if load_success else {}
+
 # ---------------------------
 # App Layout
 # ---------------------------
@@ -187,84 +346,99 @@ app.layout = html.Div([
         placeholder="Select Provinces to highlight"
     ),
     dcc.Store(id='clicked-markers', data=[]),
+    dcc.Store(id='zoom-tier', data='low'),
     dcc.Graph(id='choropleth-map')
 ])
 
+# ---------------------------
+# Callback: Pick the GeoJSON Tier for the Current Zoom (runs in the browser)
+# ---------------------------
+app.clientside_callback(
+    """
+    function(relayoutData, tier) {
+        var zoom = relayoutData ? relayoutData["mapbox.zoom"] : undefined;
+        if (zoom === undefined) {
+            return window.dash_clientside.no_update;
+        }
+        var next = zoom < 4 ? "low" : (zoom < 6 ? "mid" : "high");
+        return next === tier ? window.dash_clientside.no_update : next;
+    }
+    """,
+    Output('zoom-tier', 'data'),
+    Input('choropleth-map', 'relayoutData'),
+    State('zoom-tier', 'data')
+)
+
 # ---------------------------
 # Callback to Update Map Based on Province Selection
 # ---------------------------
 @app.callback(
     Output('choropleth-map', 'figure'),
     [Input('province-dropdown', 'value'),
-     Input('clicked-markers', 'data')]
+     Input('clicked-markers', 'data'),
+     Input('zoom-tier', 'data')]
 )
-def update_province_map(selected_provinces, clicked_markers):
+def update_province_map(selected_provinces, clicked_markers, zoom_tier):
     if not load_success:
         return {'data': [], 'layout': {'title': 'Data loading failed'}}
     
-    # Default map settings
-    center = {"lat": 56.130, "lon": -106.347}
-    zoom = 2
+    if zoom_tier not in GEOJSON_TIERS:
+        zoom_tier = 'low'
     
-    # If no provinces selected, show all provinces in light gray
-    if not selected_provinces or len(selected_provinces) == 0:
-        df = pd.DataFrame({'Province': provinces})
-        fig = px.choropleth_mapbox(
-            df,
-            geojson=geojson_data,
-            locations='Province',
-            featureidkey="properties.shapeName",
-            color_discrete_sequence=["lightgray"],
-            mapbox_style="carto-positron",
-            zoom=zoom,
-            center=center,
-            opacity=0.5,
-        )
-        fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
-        return fig
+    # A marker click only changes marker colours, so patch the POI trace
+    # (data[1]) in place instead of resending the whole figure. Sorted like
+    # _build_figure's key, so the colours line up with the drawn markers
+    if ctx.triggered_id == 'clicked-markers':
+        idx = poi_indices(tuple(sorted(selected_provinces or [])))
+        if idx is None:
+            return no_update
+        patch = Patch()
+        patch['data'][1]['marker']['color'] = marker_colors(idx, clicked_markers)
+        return patch
     
-    # Filter to selected provinces
-    selected_provinces_df = pd.DataFrame({'Province': selected_provinces})
+    # If no provinces selected, show all provinces in light gray
+    if not selected_provinces:
+        return _DEFAULT_FIGURE_JSON[zoom_tier]
     
-    # Create base map with selected provinces
-    fig = px.choropleth_mapbox(
-        selected_provinces_df,
-        geojson=geojson_data,
-        locations='Province',
-        featureidkey="properties.shapeName",
-        color_discrete_sequence=["blue"],
-        hover_data=['Province'],
-        mapbox_style="carto-positron",
-        zoom=zoom,
-        center=center,
-        opacity=0.7,
+    # Sorted tuples make each (selection, clicked) state one hashable cache key
+    return _build_figure(tuple(sorted(selected_provinces or [])), tuple(sorted(clicked_markers or [])), zoom_tier)
+
+def poi_indices(selected_provinces):
+    """POI row indices of the selected provinces, or None when they have no POIs"""
+    idx_parts = [poi_index_by_province[prov] for prov in selected_provinces if prov in poi_index_by_province]
+    return np.concatenate(idx_parts) if idx_parts else None
+
+def marker_colors(idx, clicked_markers):
+    """Green for clicked markers, red for the rest (one hashed isin, no per-row lambda)"""
+    return np.where(np.isin(poi_marker_id[idx], list(clicked_markers or [])), 'green', 'red')
+
+@lru_cache(maxsize=128)
+def _build_figure(selected_provinces, clicked_markers, zoom_tier):
+    """Build the map for a (selection, clicked, tier) state; repeated states are
+    served from the LRU cache instead of being rebuilt"""
+    # Create base map with the selected provinces highlighted in blue
+    fig = build_province_figure(
+        [province_layer(prov, 'blue', 0.7, zoom_tier) for prov in selected_provinces],
+        selected_provinces,
     )
     
-    # Efficiently filter POI data for selected provinces
-    filtered_poi = poi_df[poi_df['province'].isin(selected_provinces)]
-    
     # Add markers for selected provinces (if any POIs exist)
-    if not filtered_poi.empty:
-        # Set marker colors based on clicked status
-        filtered_poi['color'] = filtered_poi['marker_id'].apply(
-            lambda x: 'green' if x in clicked_markers else 'red'
-        )
-        
+    idx = poi_indices(selected_provinces)
+    if idx is not None:
         # Add all markers in a single trace for better performance
         fig.add_trace(go.Scattermapbox(
-            lat=filtered_poi['lat'].tolist(),
-            lon=filtered_poi['lon'].tolist(),
+            lat=poi_lat[idx],
+            lon=poi_lon[idx],
             mode='markers',
             marker=dict(
                 size=10,
-                color=filtered_poi['color'].tolist(),
+                color=marker_colors(idx, clicked_markers),
             ),
-            text=filtered_poi['place'].tolist(),
+            text=poi_place[idx],
             hoverinfo='text',
-            customdata=filtered_poi['marker_id'].tolist(),
+            customdata=poi_marker_id[idx],
         ))
     
-    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
     return fig
 
 # ---------------------------
@@ -287,11 +461,11 @@ def update_clicked_markers(clickData, current_clicked):
     
     marker_id = point['customdata']
     
-    # Toggle marker status
-    if marker_id in current_clicked:
-        return [mid for mid in current_clicked if mid != marker_id]
-    else:
-        return current_clicked + [marker_id]
+    # Toggle marker status with a hash set instead of rebuilding the list;
+    # returning it sorted keeps the stored value stable for the same set
+    clicked = set(current_clicked)
+    clicked.symmetric_difference_update({marker_id})
+    return sorted(clicked)
 
 if __name__ == '__main__':
     app.run_server(debug=False)
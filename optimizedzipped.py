@@ -2,16 +2,16 @@
 # coding: utf-8
 
 import os
+from functools import lru_cache
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, Patch, ctx, no_update
 import plotly.express as px
 import plotly.graph_objects as go
-import geopandas as gpd
 import pandas as pd
-import json
+import numpy as np
+import orjson
 import zipfile
-from shapely.geometry import shape
-import tempfile
+import shapely
 
 # ---------------------------
 # Initialize Dash App
@@ -23,13 +23,17 @@ server = app.server  # Important for gunicorn deployment
 # Load and Prepare Data (with optimizations)
 # ---------------------------
 
+@lru_cache(maxsize=None)
+def open_zip(zip_path):
+    """Open an archive once and keep it open, so its central directory is
+    parsed a single time however many members are read"""
+    return zipfile.ZipFile(zip_path, 'r')
+
 # Function to extract a specific file from a zip archive to memory
 def extract_file_from_zip(zip_path, file_name):
     """Extract a single file from a zip archive and return its content"""
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            with zip_ref.open(file_name) as file:
-                return file.read()
+        return open_zip(zip_path).read(file_name)
     except Exception as e:
         print(f"Error extracting {file_name} from {zip_path}: {e}")
         return None
@@ -38,30 +42,28 @@ def extract_file_from_zip(zip_path, file_name):
 def load_and_simplify_geojson(geojson_data, tolerance=0.05):
     """Load GeoJSON and apply simplification to reduce memory footprint"""
     try:
-        # Parse GeoJSON from bytes if needed
-        if isinstance(geojson_data, bytes):
-            geojson_data = json.loads(geojson_data.decode('utf-8'))
-        elif isinstance(geojson_data, str):
-            geojson_data = json.loads(geojson_data)
+        # Parse GeoJSON from bytes if needed (orjson decodes UTF-8 bytes directly)
+        if isinstance(geojson_data, (bytes, str)):
+            geojson_data = orjson.loads(geojson_data)
         
-        # Create GeoDataFrame
-        gdf = gpd.GeoDataFrame.from_features(geojson_data['features'])
-        gdf = gdf.rename(columns={"shapeName": "Province"})
-        gdf.set_crs(epsg=4326, inplace=True)
+        features = geojson_data['features']
         
-        # Simplify geometries with higher tolerance to reduce memory
-        gdf['geometry'] = gdf['geometry'].simplify(tolerance=tolerance)
+        # Simplify geometries with higher tolerance to reduce memory. shapely's
+        # vectorised functions parse, simplify and re-encode every geometry in
+        # bulk, without building a GeoDataFrame
+        geometries = shapely.from_geojson([orjson.dumps(feature['geometry']) for feature in features])
+        simplified = shapely.simplify(geometries, tolerance=tolerance)
+        for feature, geometry in zip(features, shapely.to_geojson(simplified)):
+            feature['geometry'] = orjson.loads(geometry)
         
         # Only keep necessary columns
-        if 'Province' not in gdf.columns and 'shapeName' in gdf.columns:
-            gdf = gdf.rename(columns={"shapeName": "Province"})
-        gdf = gdf[['Province', 'geometry']]
+        provinces_df = pd.DataFrame({"Province": [feature['properties']['shapeName'] for feature in features]})
         
-        return gdf, geojson_data
+        return provinces_df, geojson_data
     except Exception as e:
         print(f"Error loading GeoJSON: {e}")
         # Provide fallback minimal data if file can't be loaded
-        return gpd.GeoDataFrame(), {}
+        return pd.DataFrame(columns=["Province"]), {}
 
 # Define notable places per province (as lists)
 province_to_places = {
@@ -80,6 +82,9 @@ province_to_places = {
     "Yukon": ["Kluane NP", "Miles Canyon", "SS Klondike", "Whitehorse", "Tombstone Park"]
 }
 
+# Comma-separated hover string per province, joined once
+notable_places_text = {prov: ", ".join(places) for prov, places in province_to_places.items()}
+
 # Load province GeoJSON from ZIP file
 geojson_zip = 'data.zip'
 province_geojson_filename = 'geoBoundaries-CAN-ADM1_simplified.geojson'
@@ -87,15 +92,17 @@ province_geojson_filename = 'geoBoundaries-CAN-ADM1_simplified.geojson'
 # Try to extract and load the province boundaries
 province_geojson_data = extract_file_from_zip(geojson_zip, province_geojson_filename)
 if province_geojson_data:
-    gdf, geojson_data = load_and_simplify_geojson(province_geojson_data)
+    provinces_df, geojson_data = load_and_simplify_geojson(province_geojson_data)
 else:
     print("Failed to extract province GeoJSON data")
     # Create empty dataframes as fallback
-    gdf = gpd.GeoDataFrame(columns=["Province", "geometry"])
+    provinces_df = pd.DataFrame(columns=["Province"])
     geojson_data = {"type": "FeatureCollection", "features": []}
 
-# For hover info, add a comma-separated string of notable places to gdf
-gdf["Notable Places"] = gdf["Province"].map(lambda prov: ", ".join(province_to_places.get(prov, [])))
+# For hover info, add a comma-separated string of notable places to provinces_df
+# (13 distinct names, so a categorical lets the dict lookup run per category)
+provinces_df["Province"] = provinces_df["Province"].astype("category")
+provinces_df["Notable Places"] = provinces_df["Province"].map(notable_places_text).astype(object).fillna("")
 
 # Create a predefined dataset of notable places with coordinates
 # This avoids loading the full POI dataset which would be memory-intensive
@@ -123,7 +130,7 @@ notable_places_data = [
 notable_df = pd.DataFrame(notable_places_data)
 
 # Generate unique marker IDs
-notable_df["marker_id"] = notable_df.apply(lambda row: f"{row['Province']}_{row['Place']}_{row.name}", axis=1)
+notable_df["marker_id"] = notable_df["Province"] + "_" + notable_df["Place"] + "_" + notable_df.index.astype(str)
 
 # ---------------------------
 # App Layout
@@ -132,7 +139,7 @@ app.layout = html.Div([
     html.H1("Canada Provinces with Notable Places"),
     dcc.Dropdown(
         id='province-dropdown',
-        options=[{'label': prov, 'value': prov} for prov in sorted(gdf['Province'].unique())],
+        options=[{'label': prov, 'value': prov} for prov in sorted(provinces_df['Province'].unique())],
         multi=True,
         placeholder="Select Provinces to highlight"
     ),
@@ -153,8 +160,11 @@ def update_clicked_markers(clickData, current_clicked):
         point = clickData['points'][0]
         if 'customdata' in point:
             marker_id = point['customdata']
-            if marker_id not in current_clicked:
-                return current_clicked + [marker_id]
+            clicked = set(current_clicked)
+            if marker_id not in clicked:
+                clicked.add(marker_id)
+                # Sorted so the same set of markers is always stored the same way
+                return sorted(clicked)
     return current_clicked
 
 @app.callback(
@@ -167,14 +177,31 @@ def update_map(selected_provinces, clicked_markers):
     if not selected_provinces:
         selected_provinces = []  # Ensure it's a list even if None
     
+    # A marker click only changes marker colours, so patch the marker trace
+    # (data[1]) in place instead of resending the figure and its GeoJSON
+    if ctx.triggered_id == 'clicked-markers':
+        marker_subset = notable_df[notable_df["Province"].isin(selected_provinces)]
+        if marker_subset.empty:
+            return no_update
+        patch = Patch()
+        patch['data'][1]['marker']['color'] = np.where(
+            marker_subset["marker_id"].isin(clicked_markers), "green", "red")
+        return patch
+    
+    # Selected provinces get z=1 (blue), everything else z=0 (light gray),
+    # computed in one vectorised isin rather than patching z per province
+    selected_z = provinces_df['Province'].isin(selected_provinces).to_numpy(dtype=np.int8)
+    
     # Create base figure
     fig = px.choropleth_mapbox(
-        gdf,
+        provinces_df.assign(selected=selected_z),
         geojson=geojson_data,
         locations='Province',
         featureidkey="properties.shapeName",
-        color_discrete_sequence=["lightgray"],
-        hover_data=["Province", "Notable Places"],
+        color='selected',
+        color_continuous_scale=[[0, "lightgray"], [1, "blue"]],
+        range_color=[0, 1],
+        hover_data={"Province": True, "Notable Places": True, "selected": False},
         mapbox_style="carto-positron",
         zoom=2,
         center={"lat": 56.130, "lon": -106.347},
@@ -183,11 +210,6 @@ def update_map(selected_provinces, clicked_markers):
     
     # Update colors for selected provinces
     if selected_provinces:
-        # Highlight selected provinces in blue
-        for i, province in enumerate(gdf['Province']):
-            if province in selected_provinces:
-                fig.data[0].z[i] = 1  # This will make the selected provinces use the second color
-        
         # Add markers for notable places in selected provinces
         marker_subset = notable_df[notable_df["Province"].isin(selected_provinces)]
         if not marker_subset.empty:
@@ -204,7 +226,7 @@ def update_map(selected_provinces, clicked_markers):
                 hoverinfo='text'
             ))
     
-    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, coloraxis_showscale=False)
     return fig
 
 # ---------------------------
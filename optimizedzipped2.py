@@ -5,13 +5,25 @@ import os
 import sys
 import dash
 from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
+import flask
+from flask_caching import Cache
+import plotly.io as pio
 import geopandas as gpd
 import pandas as pd
-import json
+import numpy as np
+import io
+import orjson
+import hashlib
+import pickle
 import zipfile
+import geobuf
+import ijson
+try:
+    import pyogrio
+except ImportError:  # optional; the ijson path below is used instead
+    pyogrio = None
 import tempfile
+import shapely
 from shapely.geometry import shape
 
 # ---------------------------
@@ -30,48 +42,65 @@ logger = logging.getLogger(__name__)
 # ---------------------------
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # Important for gunicorn deployment
+cache = Cache(server, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 300})
 
 # ---------------------------
 # Load and Prepare Data (with debugging)
 # ---------------------------
 
-def extract_file_from_zip(zip_path, file_name):
-    """Extract a single file from a zip archive and return its content"""
+def stream_features_from_zip(zip_path, file_name):
+    """Parse the features of a GeoJSON member of a zip archive one at a time,
+    without reading the whole member into memory first"""
     try:
         logger.info(f"Attempting to extract {file_name} from {zip_path}")
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             # List all files in the zip to verify content
-            logger.info(f"Files in zip: {zip_ref.namelist()}")
-            if file_name in zip_ref.namelist():
-                with zip_ref.open(file_name) as file:
-                    logger.info(f"Successfully extracted {file_name}")
-                    return file.read()
-            else:
+            names = zip_ref.namelist()
+            logger.info(f"Files in zip: {names}")
+            if file_name not in names:
                 logger.error(f"File {file_name} not found in {zip_path}")
                 # If exact name not found, try to find a similar file
-                for name in zip_ref.namelist():
-                    if file_name.lower() in name.lower():
-                        logger.info(f"Found similar file: {name}")
-                        with zip_ref.open(name) as file:
-                            return file.read()
-                return None
+                similar = [name for name in names if file_name.lower() in name.lower()]
+                if not similar:
+                    return None
+                file_name = similar[0]
+                logger.info(f"Found similar file: {file_name}")
+            # Inflate in 64 KiB reads, so only the parser's working set of the
+            # member is in memory at any time
+            with io.BufferedReader(zip_ref.open(file_name), buffer_size=65536) as file:
+                # use_float so coordinates come back as floats, not Decimals
+                features = list(ijson.items(file, 'features.item', use_float=True, buf_size=65536))
+            logger.info(f"Successfully extracted {file_name}")
+            return {"type": "FeatureCollection", "features": features}
     except Exception as e:
         logger.error(f"Error extracting {file_name} from {zip_path}: {e}")
         return None
 
+def load_and_simplify_geobuf(raw_bytes, tolerance=0.05):
+    """Decode a Geobuf (.pbf) province file and simplify it like the GeoJSON path"""
+    try:
+        geojson_data = geobuf.decode(raw_bytes)
+    except Exception as e:
+        logger.error(f"Error decoding Geobuf: {e}")
+        return gpd.GeoDataFrame(columns=["Province", "geometry"]), {"type": "FeatureCollection", "features": []}
+    # geobuf.decode returns the same FeatureCollection dict orjson.loads would
+    return load_and_simplify_geojson(geojson_data, tolerance=tolerance)
+
 def load_and_simplify_geojson(geojson_data, tolerance=0.05):
-    """Load GeoJSON and apply simplification to reduce memory footprint"""
+    """Load GeoJSON (or an already-read GeoDataFrame) and apply simplification
+    to reduce memory footprint"""
     try:
-        # Parse GeoJSON from bytes if needed
-        if isinstance(geojson_data, bytes):
-            geojson_data = json.loads(geojson_data.decode('utf-8'))
-        elif isinstance(geojson_data, str):
-            geojson_data = json.loads(geojson_data)
-        
-        logger.info(f"GeoJSON parsed successfully. Features: {len(geojson_data['features'])}")
+        if isinstance(geojson_data, gpd.GeoDataFrame):
+            gdf = geojson_data
+        else:
+            # Parse GeoJSON from bytes if needed (orjson decodes UTF-8 bytes directly)
+            if isinstance(geojson_data, (bytes, str)):
+                geojson_data = orjson.loads(geojson_data)
+            
+            # Create GeoDataFrame
+            gdf = gpd.GeoDataFrame.from_features(geojson_data['features'])
         
-        # Create GeoDataFrame
-        gdf = gpd.GeoDataFrame.from_features(geojson_data['features'])
+        logger.info(f"GeoJSON parsed successfully. Features: {len(gdf)}")
         
         # Check for shapeName column and rename if found
         if 'shapeName' in gdf.columns:
@@ -80,8 +109,11 @@ def load_and_simplify_geojson(geojson_data, tolerance=0.05):
         # Ensure CRS is set
         gdf.set_crs(epsg=4326, inplace=True)
         
-        # Simplify geometries with higher tolerance to reduce memory
-        gdf['geometry'] = gdf['geometry'].simplify(tolerance=tolerance)
+        # Simplify geometries with higher tolerance to reduce memory, in one
+        # shapely call over the whole geometry array. Not preserving topology is
+        # much faster and only drops islets smaller than the tolerance
+        simplified = shapely.simplify(gdf.geometry.to_numpy(), tolerance=tolerance, preserve_topology=False)
+        gdf = gdf.set_geometry(gpd.GeoSeries(simplified, index=gdf.index, crs='EPSG:4326'))
         
         # Verify we have the Province column
         if 'Province' not in gdf.columns:
@@ -100,7 +132,17 @@ def load_and_simplify_geojson(geojson_data, tolerance=0.05):
         else:
             logger.error("Could not find Province column")
         
-        return gdf, geojson_data
+        # Build the collection Plotly draws from the simplified geometries, so
+        # the full-resolution ones can be freed. Plotly only matches on
+        # shapeName, so that is the one property kept, and coordinates are
+        # rounded to 6 decimals (~10 cm) to shrink the JSON sent to the browser
+        names = gdf['Province'].tolist() if 'Province' in gdf.columns else [None] * len(gdf)
+        rounded = shapely.transform(gdf.geometry.to_numpy(), lambda coords: np.round(coords, 6))
+        features = [
+            {"type": "Feature", "properties": {"shapeName": name}, "geometry": geometry.__geo_interface__}
+            for name, geometry in zip(names, rounded)
+        ]
+        return gdf, {"type": "FeatureCollection", "features": features}
     except Exception as e:
         logger.error(f"Error loading GeoJSON: {e}")
         # Provide fallback minimal data
@@ -123,10 +165,18 @@ province_to_places = {
     "Yukon": ["Kluane NP", "Miles Canyon", "SS Klondike", "Whitehorse", "Tombstone Park"]
 }
 
+# The 13 province names as a fixed categorical, so Province filters and lookups
+# compare small integer codes instead of hashing strings
+PROV_CAT = pd.CategoricalDtype(categories=sorted(province_to_places.keys()), ordered=False)
+
 # Load province GeoJSON from ZIP file
 logger.info("Starting data loading process")
 geojson_zip = 'data.zip'
 province_geojson_filename = 'geoBoundaries-CAN-ADM1_simplified.geojson'
+# Geobuf copy of the same file, ~9x smaller (built by precompute_geojson.py)
+province_geobuf_filename = 'geoBoundaries-CAN-ADM1_simplified.pbf'
+# Bump whenever the preparation steps change, so stale on-disk caches are ignored
+province_cache_version = 2
 
 # Create a fallback minimal GeoDataFrame in case loading fails
 fallback_provinces = list(province_to_places.keys())
@@ -135,27 +185,85 @@ fallback_gdf = gpd.GeoDataFrame({
     "geometry": [None] * len(fallback_provinces)
 })
 
-# Try to extract and load the province boundaries
-province_geojson_data = extract_file_from_zip(geojson_zip, province_geojson_filename)
-if province_geojson_data:
+def load_provinces(tolerance):
+    """Load and simplify the province boundaries, trying the Geobuf file first
+    and falling back to the GeoJSON in the zip"""
+    if os.path.exists(province_geobuf_filename):
+        with open(province_geobuf_filename, 'rb') as f:
+            province_geojson_data = f.read()
+        logger.info(f"Read {province_geobuf_filename} ({len(province_geojson_data)} bytes)")
+        return load_and_simplify_geobuf(province_geojson_data, tolerance=tolerance)
+    if pyogrio is not None:
+        # GDAL reads straight out of the zip and only decodes the shapeName
+        # attribute, skipping the others
+        try:
+            province_gdf = gpd.read_file(f"/vsizip/{geojson_zip}/{province_geojson_filename}",
+                                         engine='pyogrio', columns=['shapeName'])
+            logger.info(f"Read {province_geojson_filename} from {geojson_zip} with pyogrio")
+            return load_and_simplify_geojson(province_gdf, tolerance=tolerance)
+        except Exception as e:
+            logger.warning(f"pyogrio could not read {province_geojson_filename}, streaming it instead: {e}")
+    province_geojson_data = stream_features_from_zip(geojson_zip, province_geojson_filename)
+    if not province_geojson_data:
+        logger.error("Failed to extract province GeoJSON data")
+        return gpd.GeoDataFrame(columns=["Province", "geometry"]), {"type": "FeatureCollection", "features": []}
     logger.info("Successfully extracted province GeoJSON data")
-    gdf, geojson_data = load_and_simplify_geojson(province_geojson_data)
+    return load_and_simplify_geojson(province_geojson_data, tolerance=tolerance)
+
+def load_with_cache(source_path, name, tolerance):
+    """Return the prepared (gdf, geojson_data) pair from a pickle under the temp
+    directory, building it with load_provinces on the first boot. The key hashes
+    the source file, so a new data file never hits a stale cache"""
+    key = hashlib.sha1()
+    try:
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                key.update(chunk)
+    except OSError as e:
+        logger.error(f"Could not hash {source_path}, skipping the cache: {e}")
+        return load_provinces(tolerance)
+    key.update(f"{name}:{tolerance}:{province_cache_version}".encode('utf-8'))
+    cache_path = os.path.join(tempfile.gettempdir(), f"prov_{key.hexdigest()}.pkl")
     
-    # Verify we have valid data
-    if gdf.empty:
-        logger.warning("GeoDataFrame is empty, using fallback")
-        gdf = fallback_gdf
-        # Create minimal geojson as well
-        geojson_data = {"type": "FeatureCollection", "features": []}
-    else:
-        logger.info(f"Loaded GeoDataFrame with {len(gdf)} rows")
-else:
-    logger.error("Failed to extract province GeoJSON data, using fallback")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            logger.info(f"Loaded prepared provinces from {cache_path}")
+            return cached
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache {cache_path}: {e}")
+    
+    gdf, geojson_data = load_provinces(tolerance)
+    if not gdf.empty:
+        try:
+            # Write to a temp name and rename, so a worker booting at the same
+            # time never reads a half-written file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((gdf, geojson_data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+            logger.info(f"Cached prepared provinces to {cache_path}")
+        except Exception as e:
+            logger.warning(f"Could not write cache {cache_path}: {e}")
+    return gdf, geojson_data
+
+province_source = province_geobuf_filename if os.path.exists(province_geobuf_filename) else geojson_zip
+gdf, geojson_data = load_with_cache(province_source, province_geojson_filename, 0.05)
+
+# Verify we have valid data
+if gdf.empty:
+    logger.warning("GeoDataFrame is empty, using fallback")
     gdf = fallback_gdf
+    # Create minimal geojson as well
     geojson_data = {"type": "FeatureCollection", "features": []}
+else:
+    logger.info(f"Loaded GeoDataFrame with {len(gdf)} rows")
 
-# Add notable places to GeoDataFrame
-gdf["Notable Places"] = gdf["Province"].map(lambda prov: ", ".join(province_to_places.get(prov, [])))
+# Add notable places to GeoDataFrame, joining each province's list once
+notable_places_text = {prov: ", ".join(places) for prov, places in province_to_places.items()}
+gdf["Province"] = gdf["Province"].astype(PROV_CAT)
+gdf["Notable Places"] = gdf["Province"].map(notable_places_text).astype(object).fillna("")
 
 # Create a predefined dataset of notable places with coordinates
 # This avoids loading the full POI dataset
@@ -178,9 +286,42 @@ notable_places_data = [
 
 # Create DataFrame from our predefined data
 notable_df = pd.DataFrame(notable_places_data)
+notable_df["Province"] = notable_df["Province"].astype(PROV_CAT)
+# 6 decimals (~10 cm) is far finer than the map needs, and float32 halves the
+# coordinate columns
+notable_df[['lat', 'lon']] = notable_df[['lat', 'lon']].round(6).astype(np.float32)
 
 # Generate unique marker IDs
-notable_df["marker_id"] = notable_df.apply(lambda row: f"{row['Province']}_{row['Place']}_{row.name}", axis=1)
+notable_df["marker_id"] = notable_df["Province"].astype(str) + "_" + notable_df["Place"].astype(str) + "_" + notable_df.index.astype(str)
+
+# Per-province column arrays (structure of arrays), sliced out of notable_df
+# once: float32 coordinates, marker ids and place names
+marker_rows = notable_df.groupby("Province", sort=False, observed=True).indices
+LAT = {prov: notable_df["lat"].to_numpy(np.float32)[rows] for prov, rows in marker_rows.items()}
+LON = {prov: notable_df["lon"].to_numpy(np.float32)[rows] for prov, rows in marker_rows.items()}
+PID = {prov: notable_df["marker_id"].to_numpy(object)[rows] for prov, rows in marker_rows.items()}
+PLACE = {prov: notable_df["Place"].to_numpy(object)[rows] for prov, rows in marker_rows.items()}
+
+def float32_to_json(values):
+    """Widen float32 coordinates through their shortest decimal form, so the
+    JSON carries 51.1784 rather than float32's 51.17839813232422"""
+    return values.astype(str).astype(np.float64).tolist()
+
+# Everything the browser needs to draw the map, sent once with the layout: the
+# province list with its hover text, and the markers bucketed by province
+map_data = {
+    "provinces": gdf["Province"].tolist(),
+    "notable_places": gdf["Notable Places"].tolist(),
+    "markers": {
+        prov: {
+            "lat": float32_to_json(LAT[prov]),
+            "lon": float32_to_json(LON[prov]),
+            "place": PLACE[prov].tolist(),
+            "id": PID[prov].tolist(),
+        }
+        for prov in marker_rows
+    },
+}
 
 # ---------------------------
 # App Layout
@@ -199,6 +340,8 @@ app.layout = html.Div([
     ], style={'margin-bottom': '20px'}),
     html.Div(id='selection-info', children="No provinces selected"),
     dcc.Store(id='clicked-markers', data=[]),
+    dcc.Store(id='prov-geojson', data=geojson_data, storage_type='memory'),
+    dcc.Store(id='map-data', data=map_data, storage_type='memory'),
     dcc.Graph(id='choropleth-map', style={'height': '700px'})
 ])
 
@@ -225,88 +368,92 @@ def update_clicked_markers(clickData, current_clicked):
         point = clickData['points'][0]
         if 'customdata' in point:
             marker_id = point['customdata']
-            if marker_id not in current_clicked:
-                logger.info(f"Marker clicked: {marker_id}")
-                return current_clicked + [marker_id]
-            else:
-                # Toggle off if clicked again
-                logger.info(f"Marker unclicked: {marker_id}")
-                return [m for m in current_clicked if m != marker_id]
+            # Toggle: a second click on the same marker removes it again
+            clicked = set(current_clicked or ())
+            clicked.symmetric_difference_update({marker_id})
+            logger.info(f"Marker {'clicked' if marker_id in clicked else 'unclicked'}: {marker_id}")
+            # Sorted so the same set of markers is always stored the same way
+            return sorted(clicked)
     return current_clicked or []
 
-@app.callback(
+# The figure is assembled in the browser from the two stores, so the province
+# GeoJSON crosses the wire once (with the layout) instead of in every response.
+# z carries the selection (0/1) and the colour scale carries each state's
+# colour and opacity
+app.clientside_callback(
+    """
+    function(selectedProvinces, clickedMarkers, geojson, mapData) {
+        const selected = selectedProvinces || [];
+        const selectedSet = new Set(selected);
+        const clickedSet = new Set(clickedMarkers || []);
+        const traces = [{
+            type: 'choroplethmapbox',
+            geojson: geojson,
+            locations: mapData.provinces,
+            featureidkey: 'properties.shapeName',
+            z: mapData.provinces.map(prov => selectedSet.has(prov) ? 1 : 0),
+            zmin: 0,
+            zmax: 1,
+            colorscale: [[0, 'rgba(211, 211, 211, 0.5)'], [1, 'rgba(0, 0, 255, 0.7)']],
+            showscale: false,
+            customdata: mapData.notable_places,
+            hovertemplate: 'Province=%{location}<br>Notable Places=%{customdata}<extra></extra>'
+        }];
+
+        // Markers for notable places in selected provinces only, so the
+        // marker trace grows with the selection rather than the POI count.
+        // concat rather than push(...spread), which overflows the call stack
+        // once a province holds more than ~100k points
+        const buckets = selected.map(prov => mapData.markers[prov]).filter(Boolean);
+        const lat = [].concat(...buckets.map(markers => markers.lat));
+        const lon = [].concat(...buckets.map(markers => markers.lon));
+        const text = [].concat(...buckets.map(markers => markers.place));
+        const ids = [].concat(...buckets.map(markers => markers.id));
+        if (ids.length) {
+            traces.push({
+                type: 'scattermapbox',
+                lat: lat,
+                lon: lon,
+                mode: 'markers',
+                marker: {size: 10, color: ids.map(id => clickedSet.has(id) ? 'green' : 'red')},
+                text: text,
+                customdata: ids,
+                hoverinfo: 'text'
+            });
+        }
+
+        return {
+            data: traces,
+            layout: {
+                margin: {r: 0, t: 0, l: 0, b: 0},
+                mapbox: {style: 'carto-positron', zoom: 2, center: {lat: 56.130, lon: -106.347}},
+                // Keep the user's pan/zoom when the selection changes
+                uirevision: 'constant'
+            }
+        };
+    }
+    """,
     Output('choropleth-map', 'figure'),
     Input('province-dropdown', 'value'),
-    Input('clicked-markers', 'data')
+    Input('clicked-markers', 'data'),
+    State('prov-geojson', 'data'),
+    State('map-data', 'data')
 )
-def update_map(selected_provinces, clicked_markers):
-    logger.info(f"Updating map with selected provinces: {selected_provinces}")
-    logger.info(f"Clicked markers: {clicked_markers}")
-    
-    # Handle None or empty selections
-    if not selected_provinces:
-        selected_provinces = []
-    
-    # Create two separate dataframes - one for selected provinces and one for unselected
-    selected_gdf = gdf[gdf["Province"].isin(selected_provinces)] if selected_provinces else gpd.GeoDataFrame()
-    unselected_gdf = gdf[~gdf["Province"].isin(selected_provinces)] if selected_provinces else gdf
-    
-    # Base figure with unselected provinces
-    fig = px.choropleth_mapbox(
-        unselected_gdf,
-        geojson=geojson_data,
-        locations='Province',
-        featureidkey="properties.shapeName",
-        color_discrete_sequence=["lightgray"],
-        hover_data=["Province", "Notable Places"],
-        mapbox_style="carto-positron",
-        zoom=2,
-        center={"lat": 56.130, "lon": -106.347},
-        opacity=0.5,
-    )
-    
-    # Add selected provinces with different color
-    if not selected_gdf.empty:
-        selected_fig = px.choropleth_mapbox(
-            selected_gdf,
-            geojson=geojson_data,
-            locations='Province',
-            featureidkey="properties.shapeName",
-            color_discrete_sequence=["blue"],
-            hover_data=["Province", "Notable Places"],
-            opacity=0.7,
-        )
-        fig.add_trace(selected_fig.data[0])
-    
-    # Add markers for notable places in selected provinces
-    if selected_provinces:
-        marker_subset = notable_df[notable_df["Province"].isin(selected_provinces)]
-        if not marker_subset.empty:
-            logger.info(f"Adding {len(marker_subset)} markers for selected provinces")
-            
-            marker_colors = ["green" if marker_id in clicked_markers else "red"
-                         for marker_id in marker_subset["marker_id"]]
-            
-            fig.add_trace(go.Scattermapbox(
-                lat=marker_subset["lat"],
-                lon=marker_subset["lon"],
-                mode='markers',
-                marker=dict(size=10, color=marker_colors),
-                text=marker_subset["Place"],
-                customdata=marker_subset["marker_id"],
-                hoverinfo='text'
-            ))
-    
-    fig.update_layout(
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        mapbox_style="carto-positron",
-        mapbox=dict(
-            zoom=2,
-            center={"lat": 56.130, "lon": -106.347},
-        )
-    )
-    
-    return fig
+
+# ---------------------------
+# Layout caching
+# ---------------------------
+# With the figure built in the browser, the layout (which carries the GeoJSON
+# store) is the one expensive response left, and it never changes. Serialize
+# it once per process and serve the cached JSON on every page load
+@cache.memoize(timeout=0)
+def layout_json():
+    return pio.json.to_json_plotly(app.layout)
+
+def serve_cached_layout():
+    return flask.Response(layout_json(), mimetype="application/json")
+
+server.view_functions[app.config.routes_pathname_prefix + '_dash-layout'] = serve_cached_layout
 
 # ---------------------------
 # Run the server
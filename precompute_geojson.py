@@ -0,0 +1,43 @@
+"""Precompute the simplified province GeoJSON tiers the apps load at startup.
+
+Also writes the unsimplified boundaries as Geobuf, protobuf-encoded GeoJSON
+at 6-digit precision (the same output as `json2geobuf -p 6`), for apps that
+simplify at startup themselves.
+
+Re-run whenever data.zip or the tolerances change:
+    python precompute_geojson.py
+"""
+import gzip
+import zipfile
+import orjson
+import geobuf
+import geopandas as gpd
+
+ZIP_PATH = 'data.zip'
+GEOJSON_NAME = 'geoBoundaries-CAN-ADM1_simplified.geojson'
+OUTPUT_NAME = 'provinces_simplified_{tier}.json.gz'
+GEOBUF_NAME = 'geoBoundaries-CAN-ADM1_simplified.pbf'
+
+# Keep in sync with GEOJSON_TIERS in optimized.py and provinceszipped2.py
+TIERS = {'low': 0.2, 'mid': 0.05, 'high': 0.01}
+
+def main():
+    with zipfile.ZipFile(ZIP_PATH, 'r') as zip_ref:
+        geojson_data = orjson.loads(zip_ref.read(GEOJSON_NAME))
+    gdf = gpd.GeoDataFrame.from_features(geojson_data['features'])
+
+    for tier, tolerance in TIERS.items():
+        # Not topology-preserving, so islets below the tolerance drop out
+        simplified = gdf.assign(geometry=gdf['geometry'].simplify(tolerance, preserve_topology=False))
+        output_name = OUTPUT_NAME.format(tier=tier)
+        # mtime=0 keeps the output byte-identical between runs on the same input
+        with gzip.GzipFile(output_name, 'wb', mtime=0) as f:
+            f.write(simplified.to_json().encode('utf-8'))
+        print(f"Wrote {output_name} ({len(simplified)} features, tolerance={tolerance})")
+
+    with open(GEOBUF_NAME, 'wb') as f:
+        f.write(geobuf.encode(geojson_data, 6))
+    print(f"Wrote {GEOBUF_NAME} ({len(geojson_data['features'])} features)")
+
+if __name__ == '__main__':
+    main()
@@ -8,32 +8,112 @@ import dash
 from dash import dcc, html, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
-import geopandas as gpd
+import plotly.io as pio
 import pandas as pd
-import json
+import orjson
 import zipfile
+import gzip
 import os
-from shapely.geometry import shape
+from functools import lru_cache
+import shapely
 
 # ---------------------------
-# Unzip GeoJSON files (Run once on startup)
+# Read GeoJSON straight from the zip (no extraction to disk)
 # ---------------------------
-def unzip_geojsons(zip_path, extract_to='.'):
-    """Unzip GeoJSON files from a zip archive"""
+def read_from_zip(zip_path, file_name):
+    """Return the bytes of a single member of a zip archive, or None"""
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
-        print(f"Extracted files from {zip_path}")
-        return True
+            return zip_ref.read(file_name)
     except FileNotFoundError:
         print(f"Error: Zip file not found at {zip_path}")
-        return False
+        return None
     except Exception as e:
-        print(f"Error unzipping {zip_path}: {e}")
-        return False
+        print(f"Error reading {file_name} from {zip_path}: {e}")
+        return None
 
 geojson_zip = 'data.zip'  #  Make sure this file is in the same directory.
-unzipped = unzip_geojsons(geojson_zip)
+
+# ---------------------------
+# Parse the province GeoJSON once at startup; callbacks read these instead of
+# re-reading and re-parsing the file on every interaction
+# ---------------------------
+province_geojson_name = 'geoBoundaries-CAN-ADM1_simplified.geojson'
+
+@lru_cache(maxsize=None)
+def load_province_geojson():
+    """Parse the raw province GeoJSON from data.zip, at most once per process.
+    Only needed for tiers that precompute_geojson.py hasn't written"""
+    geojson_bytes = read_from_zip(geojson_zip, province_geojson_name)
+    if not geojson_bytes:
+        return None
+    try:
+        return orjson.loads(geojson_bytes)
+    except Exception as e:
+        print(f"Error loading {province_geojson_name}: {e}")
+        return None
+
+def simplify_features(features, tolerance=0.01):
+    """Simplify every province in one vectorised shapely call, rather than the
+    selected ones on every callback. Not preserving topology is much faster
+    here and only drops islets smaller than the tolerance"""
+    geometries = shapely.from_geojson([orjson.dumps(feature['geometry']) for feature in features])
+    simplified = shapely.simplify(geometries, tolerance=tolerance, preserve_topology=False)
+    return [
+        {"type": "Feature", "properties": {"shapeName": feature['properties']['shapeName']},
+         "geometry": orjson.loads(geometry)}
+        for feature, geometry in zip(features, shapely.to_geojson(simplified))
+    ]
+
+# Simplification tolerance (degrees) per zoom tier; the client switches tiers
+# as the user zooms, so the continent view never pays for full detail.
+# Keep in sync with TIERS in precompute_geojson.py
+GEOJSON_TIERS = {'low': 0.2, 'mid': 0.05, 'high': 0.01}
+
+def load_tier_features(tier, tolerance):
+    """Simplified features of one zoom tier, read from precompute_geojson.py's
+    output when it exists. Otherwise simplified from the raw GeoJSON and
+    written in the same format, so the next start reads it back instead"""
+    precomputed_path = f'provinces_simplified_{tier}.json.gz'
+    if os.path.exists(precomputed_path):
+        with gzip.open(precomputed_path, 'rb') as f:
+            features = orjson.loads(f.read())['features']
+        return [
+            {"type": "Feature", "properties": {"shapeName": feature['properties']['shapeName']},
+             "geometry": feature['geometry']}
+            for feature in features
+        ]
+    province_geojson = load_province_geojson()
+    if not province_geojson:
+        return []
+    features = simplify_features(province_geojson['features'], tolerance)
+    try:
+        # Written under a per-process name and renamed into place, so workers
+        # starting together never read a half-written file
+        partial_path = f"{precomputed_path}.{os.getpid()}.part"
+        with gzip.open(partial_path, 'wb') as f:
+            f.write(orjson.dumps({"type": "FeatureCollection", "features": features}))
+        os.replace(partial_path, precomputed_path)
+    except OSError as e:
+        print(f"Error writing {precomputed_path}: {e}")
+    return features
+
+# Tier -> name -> simplified feature, what the map figures are drawn from
+features_by_name = {}
+tier_geojson = {}
+for tier, tolerance in GEOJSON_TIERS.items():
+    tier_features = load_tier_features(tier, tolerance)
+    features_by_name[tier] = {feature['properties']['shapeName']: feature for feature in tier_features}
+    tier_geojson[tier] = {"type": "FeatureCollection", "features": tier_features}
+provinces_sorted = sorted(features_by_name['high'])
+
+@lru_cache(maxsize=64)
+def selected_geojson(selected, tier):
+    """FeatureCollection of the provinces in the frozenset `selected` at one
+    zoom tier, built once per distinct selection"""
+    return {"type": "FeatureCollection", "features": [
+        features_by_name[tier][prov] for prov in sorted(selected) if prov in features_by_name[tier]
+    ]}
 
 # ---------------------------
 # Hardcoded Coordinates
@@ -133,44 +213,44 @@ hardcoded_poi_coordinates = {
 }
 
 # Initialize Dash App
-app = dash.Dash(__name__)
+# compress=True gzips responses via flask-compress; plotly's orjson engine
+# encodes the figure's geojson coordinates much faster than stdlib json
+app = dash.Dash(__name__, compress=True)
 server = app.server  # This is the important line for Render/Gunicorn
+pio.json.config.default_engine = 'orjson'
 
 app.layout = html.Div([
     html.H1("Canada Provinces with Notable Places"),
     dcc.Dropdown(
         id='province-dropdown',
-        options=[],
+        # Names are known at import, so the options ship with the layout
+        options=[{'label': prov, 'value': prov} for prov in provinces_sorted],
         multi=True,
         placeholder="Select Provinces to highlight"
     ),
-    dcc.Store(id='province-list'),  # Store a simple list of provinces
     dcc.Store(id='clicked-markers', data=[]),
+    dcc.Store(id='zoom-tier', data='low'),
     dcc.Graph(id='choropleth-map')
 ])
 
 # ---------------------------
-# Callback to Load Province Names and Store Them
+# Callback: Pick the GeoJSON Tier for the Current Zoom (runs in the browser)
 # ---------------------------
-@app.callback(
-    [Output('province-dropdown', 'options'),
-     Output('province-list', 'data')],
-    Input('province-dropdown', 'id')
+app.clientside_callback(
+    """
+    function(relayoutData, tier) {
+        var zoom = relayoutData ? relayoutData["mapbox.zoom"] : undefined;
+        if (zoom === undefined) {
+            return window.dash_clientside.no_update;
+        }
+        var next = zoom < 4 ? "low" : (zoom < 6 ? "mid" : "high");
+        return next === tier ? window.dash_clientside.no_update : next;
+    }
+    """,
+    Output('zoom-tier', 'data'),
+    Input('choropleth-map', 'relayoutData'),
+    State('zoom-tier', 'data')
 )
-def load_province_names(dummy_id):
-    if not unzipped:
-        return [], []
-
-    province_geojson_path = 'geoBoundaries-CAN-ADM1_simplified.geojson'
-    try:
-        with open(province_geojson_path) as f:
-            geojson_data = json.load(f)
-        provinces = sorted([feature['properties']['shapeName'] for feature in geojson_data['features']])
-        province_options = [{'label': prov, 'value': prov} for prov in provinces]
-        return province_options, provinces
-    except Exception as e:
-        print(f"Error loading province names: {e}")
-        return [], []
 
 # ---------------------------
 # Callback to Update Map Based on Province Selection
@@ -178,23 +258,21 @@ def load_province_names(dummy_id):
 @app.callback(
     Output('choropleth-map', 'figure'),
     Input('province-dropdown', 'value'),
-    State('province-list', 'data'),
+    Input('zoom-tier', 'data'),
     State('clicked-markers', 'data')
 )
-def update_province_map(selected_provinces, all_provinces, clicked_markers):
-    if not unzipped:
+def update_province_map(selected_provinces, zoom_tier, clicked_markers):
+    if not provinces_sorted:
         return {'data': [], 'layout': {'title': 'Data loading failed'}}
+    if zoom_tier not in GEOJSON_TIERS:
+        zoom_tier = 'low'
 
-    province_geojson_path = 'geoBoundaries-CAN-ADM1_simplified.geojson'
     try:
-        with open(province_geojson_path) as f:
-            geojson_data = json.load(f)
-
         if not selected_provinces:
-            if all_provinces:
+            if provinces_sorted:
                 fig = px.choropleth_mapbox(
-                    pd.DataFrame({'Province': all_provinces}),
-                    geojson=geojson_data,
+                    pd.DataFrame({'Province': provinces_sorted}),
+                    geojson=tier_geojson[zoom_tier],
                     locations='Province',
                     featureidkey="properties.shapeName",
                     color_discrete_sequence=["lightgray"],
@@ -204,42 +282,21 @@ def update_province_map(selected_provinces, all_provinces, clicked_markers):
                     center={"lat": 56.130, "lon": -106.347},
                     opacity=0.5,
                 )
-                fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+                # Keep the user's zoom/pan when the tier or selection changes
+                fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, uirevision='constant')
                 return fig
             else:
                 return {'data': [], 'layout': {'title': 'No province data available', 'margin': {"r": 0, "t": 0, "l": 0, "b": 0}}}
 
-        filtered_features = [
-            feat for feat in geojson_data['features']
-            if feat['properties']['shapeName'] in selected_provinces
-        ]
-        filtered_gdf = gpd.GeoDataFrame.from_features(filtered_features)
-        if not filtered_gdf.empty:
-            filtered_gdf.rename(columns={"shapeName": "Province"}, inplace=True)
-            filtered_gdf.set_crs(epsg=4326, inplace=True)
-            filtered_gdf['geometry'] = filtered_gdf['geometry'].simplify(tolerance=0.01)
-
-            # Add markers for selected provinces
-            markers = []
-            for province in selected_provinces:
-                for poi in hardcoded_poi_coordinates.get(province, []):
-                    marker = go.Scattermapbox(
-                        lat=[poi['lat']],
-                        lon=[poi['lon']],
-                        mode='markers',
-                        marker=go.scattermapbox.Marker(
-                            size=10,
-                            color='red'
-                        ),
-                        text=poi['place'],
-                        hoverinfo='text',
-                        customdata=[poi['marker_id']],  # Store a unique ID for clicked detection
-                    )
-                    markers.append(marker)
+        filtered_geojson = selected_geojson(frozenset(selected_provinces), zoom_tier)
+        filtered_features = filtered_geojson['features']
+        if filtered_features:
+            # Markers for the selected provinces' POIs, batched into one trace
+            pois = [poi for province in selected_provinces for poi in hardcoded_poi_coordinates.get(province, [])]
 
             fig = px.choropleth_mapbox(
-                filtered_gdf,
-                geojson={"type": "FeatureCollection", "features": filtered_features},
+                pd.DataFrame({'Province': [feat['properties']['shapeName'] for feat in filtered_features]}),
+                geojson=filtered_geojson,
                 locations='Province',
                 featureidkey="properties.shapeName",
                 color_discrete_sequence=["blue"],
@@ -249,9 +306,20 @@ def update_province_map(selected_provinces, all_provinces, clicked_markers):
                 center={"lat": 56.130, "lon": -106.347},
                 opacity=0.7,
             )
-            fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
-            # Add the marker traces to the figure
-            fig.add_traces(markers)
+            fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, uirevision='constant')
+            if pois:
+                fig.add_trace(go.Scattermapbox(
+                    lat=[poi['lat'] for poi in pois],
+                    lon=[poi['lon'] for poi in pois],
+                    mode='markers',
+                    marker=go.scattermapbox.Marker(
+                        size=10,
+                        color='red'
+                    ),
+                    text=[poi['place'] for poi in pois],
+                    hoverinfo='text',
+                    customdata=[[poi['marker_id']] for poi in pois],  # Store a unique ID for clicked detection
+                ))
             return fig
         else:
             return {'data': [], 'layout': {'title': 'No provinces selected', 'margin': {"r": 0, "t": 0, "l": 0, "b": 0}}}
@@ -262,19 +330,26 @@ def update_province_map(selected_provinces, all_provinces, clicked_markers):
 
 
 # ---------------------------
-# Callback: Update Clicked Markers List
+# Callback: Update Clicked Markers List (runs in the browser)
 # ---------------------------
-@app.callback(
+app.clientside_callback(
+    """
+    function(clickData, currentClicked) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!clickData || !clickData.points || !clickData.points.length) {
+            return noUpdate;
+        }
+        const point = clickData.points[0];
+        if (!point.customdata) {
+            return noUpdate;
+        }
+        const markerId = point.customdata[0];  // Get the marker_id from customdata
+        const clicked = currentClicked || [];
+        return clicked.includes(markerId) ? noUpdate : clicked.concat([markerId]);
+    }
+    """,
     Output('clicked-markers', 'data'),
     Input('choropleth-map', 'clickData'),
     State('clicked-markers', 'data')
 )
-def update_clicked_markers(clickData, current_clicked):
-    if clickData and 'points' in clickData:
-        point = clickData['points'][0]
-        if 'customdata' in point:
-            marker_id = point['customdata'][0]  # Get the marker_id from customdata
-            if marker_id not in current_clicked:
-                return current_clicked + [marker_id]
-    return current_clicked
 
@@ -5,24 +5,38 @@
 
 
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, ctx, no_update
 import plotly.express as px
 import plotly.graph_objects as go
-import geopandas as gpd
 import pandas as pd
 import json
 import zipfile
 import os
+import shutil
 from shapely.geometry import shape
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
 
 # ---------------------------
 # Unzip GeoJSON files (Run once on startup)
 # ---------------------------
 def unzip_geojsons(zip_path, extract_to='.'):
-    """Unzip GeoJSON files from a zip archive"""
+    """Unzip GeoJSON files from a zip archive. Each member is written under a
+    per-process temporary name and renamed into place, so gunicorn workers
+    booting together never read a file another worker is half-way through"""
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
+            for member in zip_ref.infolist():
+                if member.is_dir():
+                    continue
+                target = os.path.join(extract_to, member.filename)
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                partial = f"{target}.{os.getpid()}.part"
+                with zip_ref.open(member) as src, open(partial, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                os.replace(partial, target)
         print(f"Extracted files from {zip_path}")
         return True
     except FileNotFoundError:
@@ -33,7 +47,42 @@ def unzip_geojsons(zip_path, extract_to='.'):
         return False
 
 geojson_zip = 'data.zip'  #  Make sure this file is in the same directory.
-unzipped = unzip_geojsons(geojson_zip)
+province_geojson_path = 'geoBoundaries-CAN-ADM1_simplified.geojson'
+# Skip the unzip when an earlier start (or another worker) already extracted it
+unzipped = os.path.exists(province_geojson_path) or unzip_geojsons(geojson_zip)
+
+# ---------------------------
+# FlatGeobuf copy of the provinces, for filtered reads
+# ---------------------------
+province_fgb_path = 'geoBoundaries-CAN-ADM1_simplified.fgb'
+
+def build_province_fgb():
+    """Convert the province GeoJSON to FlatGeobuf once, so a selection can be
+    read with an attribute filter GDAL applies while reading, instead of
+    parsing every province in Python and discarding most of them"""
+    if pyogrio is None or not unzipped:
+        return False
+    if os.path.exists(province_fgb_path):
+        return True
+    try:
+        provinces = pyogrio.read_dataframe(province_geojson_path, columns=['shapeName'])
+        # The temporary name keeps the .fgb extension, or GDAL's FlatGeobuf
+        # driver writes a directory of layers instead of a single file
+        partial = f"{os.path.splitext(province_fgb_path)[0]}.{os.getpid()}.tmp.fgb"
+        pyogrio.write_dataframe(provinces, partial, driver='FlatGeobuf')
+        os.replace(partial, province_fgb_path)
+        return True
+    except Exception as e:
+        print(f"Error writing {province_fgb_path}: {e}")
+        return False
+
+province_fgb = build_province_fgb()
+
+def read_selected_features(selected_provinces):
+    """GeoJSON features of just the selected provinces, read from the FlatGeobuf"""
+    names = ", ".join("'" + name.replace("'", "''") + "'" for name in set(selected_provinces))
+    selected = pyogrio.read_dataframe(province_fgb_path, columns=['shapeName'], where=f"shapeName IN ({names})")
+    return selected.to_geo_dict(drop_id=True)['features']
 
 # ---------------------------
 # Hardcoded Coordinates
@@ -144,81 +193,54 @@ app.layout = html.Div([
         multi=True,
         placeholder="Select Provinces to highlight"
     ),
+    # The map is rebuilt on the server, so redraw once per finished selection
+    # rather than on every pick in the multi-select
+    html.Button("Apply", id='apply-button'),
     dcc.Store(id='province-list'),  # Store a simple list of provinces
     dcc.Store(id='clicked-markers', data=[]),
     dcc.Graph(id='choropleth-map')
 ])
 
 # ---------------------------
-# Callback to Load Province Names and Store Them
+# Figure Builder
 # ---------------------------
-@app.callback(
-    [Output('province-dropdown', 'options'),
-     Output('province-list', 'data')],
-    Input('province-dropdown', 'id')
-)
-def load_province_names(dummy_id):
-    if not unzipped:
-        return [], []
+def make_figure(provinces, color, opacity, geojson):
+    """Choropleth of the given provinces in a single colour; both the
+    no-selection and selection views are built through here"""
+    fig = px.choropleth_mapbox(
+        pd.DataFrame({'Province': provinces}),
+        geojson=geojson,
+        locations='Province',
+        featureidkey="properties.shapeName",
+        color_discrete_sequence=[color],
+        hover_data=['Province'],
+        mapbox_style="carto-positron",
+        zoom=2,
+        center={"lat": 56.130, "lon": -106.347},
+        opacity=opacity,
+    )
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
 
-    province_geojson_path = 'geoBoundaries-CAN-ADM1_simplified.geojson'
+def province_figure(geojson_data, selected_provinces, all_provinces, clicked_markers):
+    """Map for the current selection, or all provinces in gray without one"""
     try:
-        with open(province_geojson_path) as f:
-            geojson_data = json.load(f)
-        provinces = sorted([feature['properties']['shapeName'] for feature in geojson_data['features']])
-        province_options = [{'label': prov, 'value': prov} for prov in provinces]
-        return province_options, provinces
-    except Exception as e:
-        print(f"Error loading province names: {e}")
-        return [], []
-
-# ---------------------------
-# Callback to Update Map Based on Province Selection
-# ---------------------------
-@app.callback(
-    Output('choropleth-map', 'figure'),
-    Input('province-dropdown', 'value'),
-    State('province-list', 'data'),
-    State('clicked-markers', 'data')
-)
-def update_province_map(selected_provinces, all_provinces, clicked_markers):
-    if not unzipped:
-        return {'data': [], 'layout': {'title': 'Data loading failed'}}
-
-    province_geojson_path = 'geoBoundaries-CAN-ADM1_simplified.geojson'
-    try:
-        with open(province_geojson_path) as f:
-            geojson_data = json.load(f)
-
         if not selected_provinces:
             if all_provinces:
-                fig = px.choropleth_mapbox(
-                    pd.DataFrame({'Province': all_provinces}),
-                    geojson=geojson_data,
-                    locations='Province',
-                    featureidkey="properties.shapeName",
-                    color_discrete_sequence=["lightgray"],
-                    hover_data=['Province'],
-                    mapbox_style="carto-positron",
-                    zoom=2,
-                    center={"lat": 56.130, "lon": -106.347},
-                    opacity=0.5,
-                )
-                fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
-                return fig
+                return make_figure(all_provinces, "lightgray", 0.5, geojson_data)
             else:
                 return {'data': [], 'layout': {'title': 'No province data available', 'margin': {"r": 0, "t": 0, "l": 0, "b": 0}}}
 
+        # Dash sends the selection as a list; test membership against a set
+        selected_set = set(selected_provinces)
         filtered_features = [
             feat for feat in geojson_data['features']
-            if feat['properties']['shapeName'] in selected_provinces
+            if feat['properties']['shapeName'] in selected_set
         ]
-        filtered_gdf = gpd.GeoDataFrame.from_features(filtered_features)
-        if not filtered_gdf.empty:
-            filtered_gdf.rename(columns={"shapeName": "Province"}, inplace=True)
-            filtered_gdf.set_crs(epsg=4326, inplace=True)
-            filtered_gdf['geometry'] = filtered_gdf['geometry'].simplify(tolerance=0.01)
-
+        # Plotly only needs the province names next to the geojson, so pass
+        # the names rather than parsing every geometry into a GeoDataFrame
+        filtered_names = [feat['properties']['shapeName'] for feat in filtered_features]
+        if filtered_names:
             # Add markers for selected provinces
             markers = []
             for province in selected_provinces:
@@ -238,19 +260,8 @@ def update_province_map(selected_provinces, all_provinces, clicked_markers):
                     )
                     markers.append(marker)
 
-            fig = px.choropleth_mapbox(
-                filtered_gdf,
-                geojson={"type": "FeatureCollection", "features": filtered_features},
-                locations='Province',
-                featureidkey="properties.shapeName",
-                color_discrete_sequence=["blue"],
-                hover_data=["Province"],
-                mapbox_style="carto-positron",
-                zoom=2,
-                center={"lat": 56.130, "lon": -106.347},
-                opacity=0.7,
-            )
-            fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+            fig = make_figure(filtered_names, "blue", 0.7,
+                              {"type": "FeatureCollection", "features": filtered_features})
             # Add the marker traces to the figure
             fig.add_traces(markers)
             return fig
@@ -260,6 +271,46 @@ def update_province_map(selected_provinces, all_provinces, clicked_markers):
         print(f"Error updating province map: {e}")
         return {'data': [], 'layout': {'title': 'Error displaying map', 'margin': {"r": 0, "t": 0, "l": 0, "b": 0}}}
 
+# ---------------------------
+# Callback to Load Province Names and Update the Map
+# ---------------------------
+@app.callback(
+    [Output('province-dropdown', 'options'),
+     Output('province-list', 'data'),
+     Output('choropleth-map', 'figure')],
+    Input('apply-button', 'n_clicks'),
+    State('province-dropdown', 'value'),
+    State('province-list', 'data'),
+    State('clicked-markers', 'data')
+)
+def update_province_map(n_clicks, selected_provinces, all_provinces, clicked_markers):
+    if not unzipped:
+        return [], [], {'data': [], 'layout': {'title': 'Data loading failed'}}
+
+    # A selection change only needs the selected provinces
+    if selected_provinces and province_fgb and ctx.triggered_id is not None:
+        try:
+            features = read_selected_features(selected_provinces)
+            return no_update, no_update, province_figure(
+                {"type": "FeatureCollection", "features": features}, selected_provinces, all_provinces, clicked_markers)
+        except Exception as e:
+            print(f"Error reading {province_fgb_path}: {e}")
+
+    try:
+        with open(province_geojson_path) as f:
+            geojson_data = json.load(f)
+    except Exception as e:
+        print(f"Error loading province names: {e}")
+        return [], [], {'data': [], 'layout': {'title': 'Error displaying map', 'margin': {"r": 0, "t": 0, "l": 0, "b": 0}}}
+
+    # The page-load call fills the dropdown and province list from the same
+    # parsed file as the map, instead of a second callback opening it again
+    if ctx.triggered_id is None:
+        all_provinces = sorted(feature['properties']['shapeName'] for feature in geojson_data['features'])
+        province_options = [{'label': prov, 'value': prov} for prov in all_provinces]
+        return province_options, all_provinces, province_figure(geojson_data, selected_provinces, all_provinces, clicked_markers)
+    return no_update, no_update, province_figure(geojson_data, selected_provinces, all_provinces, clicked_markers)
+
 
 
 # ---------------------------
@@ -279,6 +330,6 @@ def update_clicked_markers(clickData, current_clicked):
                 return current_clicked + [marker_id]
             else:
                 # Remove the marker_id if it's already in the list (toggle behavior)
-                return [marker_id for marker_id in current_clicked if marker_id != marker_id]
+                return [m for m in current_clicked if m != marker_id]
     return current_clicked
 
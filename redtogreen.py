@@ -6,11 +6,15 @@
 
 import dash
 from dash import dcc, html, Input, Output, State
-import plotly.express as px
+from flask import make_response
 import plotly.graph_objects as go
 import pandas as pd
-import json
+import numpy as np
+import orjson
 import zipfile
+import gzip
+import shapely
+from functools import lru_cache
 
 # ---------------------------
 # Memory Optimizations:
@@ -25,10 +29,68 @@ hardcoded_poi_coordinates = {
     # ... (keep your existing coordinate dictionary) ...
 }
 
-# Initialize Dash App
-app = dash.Dash(__name__)
+# POIs flattened into columns once, so update_map selects and colours them
+# with vectorised pandas ops instead of walking the nested dicts
+poi_df = pd.DataFrame(
+    [{**poi, 'province': province} for province, pois in hardcoded_poi_coordinates.items() for poi in pois],
+    columns=['province', 'place', 'lat', 'lon', 'marker_id'],
+)
+
+# ---------------------------
+# Load province GeoJSON once at startup (callbacks share it)
+# ---------------------------
+def load_geojson():
+    """Parse the province boundaries out of data.zip"""
+    try:
+        with zipfile.ZipFile('data.zip') as z:
+            with z.open('geoBoundaries-CAN-ADM1_simplified.geojson') as f:
+                return orjson.loads(f.read())
+    except Exception as e:
+        print(f"Error loading provinces: {e}")
+        return {"type": "FeatureCollection", "features": []}
+
+# Simplification tolerance in degrees (~2 km), below a pixel at zoom <= 4
+SIMPLIFY_TOLERANCE = 0.02
+
+def lighten_geojson(geojson):
+    """Keep only shapeName (the featureidkey), simplify the outlines and
+    round coordinates to 5 decimals, ~1 m and plenty for a national map, to
+    shrink what's sent to the browser"""
+    features = geojson['features']
+    geometries = shapely.from_geojson([orjson.dumps(feat['geometry']) for feat in features])
+    simplified = shapely.simplify(geometries, SIMPLIFY_TOLERANCE, preserve_topology=False)
+    rounded = shapely.transform(simplified, lambda coords: np.round(coords, 5))
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"shapeName": feat['properties']['shapeName']},
+         "geometry": geometry.__geo_interface__}
+        for feat, geometry in zip(features, rounded)
+    ]}
+
+geojson_data = lighten_geojson(load_geojson())
+features_by_name = {feat['properties']['shapeName']: feat for feat in geojson_data['features']}
+provinces_sorted = sorted(features_by_name)
+# Serialised and gzipped once; the browser fetches the geometry from this
+# rather than receiving it inside every figure's JSON
+geojson_gz = gzip.compress(orjson.dumps(geojson_data))
+GEOJSON_CACHE_SECONDS = 24 * 60 * 60
+
+# Initialize Dash App (compress=True gzips responses via flask-compress)
+app = dash.Dash(__name__, compress=True)
 server = app.server
 
+@server.route('/geojson/provinces.json')
+def serve_geojson():
+    """Pre-gzipped GeoJSON of every province"""
+    response = make_response(geojson_gz)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = f'public, max-age={GEOJSON_CACHE_SECONDS}'
+    return response
+
+def geojson_url():
+    """URL of the province GeoJSON, which Plotly fetches and caches in the browser"""
+    return app.get_relative_path('/geojson/provinces.json')
+
 app.layout = html.Div([
     html.H1("Canada Provinces with Notable Places"),
     dcc.Dropdown(
@@ -51,79 +113,78 @@ app.layout = html.Div([
     Input('province-dropdown', 'id')
 )
 def load_province_names(_):
-    try:
-        with zipfile.ZipFile('data.zip') as z:
-            with z.open('geoBoundaries-CAN-ADM1_simplified.geojson') as f:
-                geojson = json.load(f)
-                provinces = sorted(feat['properties']['shapeName'] for feat in geojson['features'])
-                return [{'label': p, 'value': p} for p in provinces], provinces
-    except Exception as e:
-        print(f"Error loading provinces: {e}")
-        return [], []
+    return [{'label': p, 'value': p} for p in provinces_sorted], provinces_sorted
+
+# ---------------------------
+# Figures
+# ---------------------------
+def province_figure(provinces, geojson, color, opacity):
+    """Choropleth of the given provinces in one colour. Builds the same trace
+    px.choropleth_mapbox would, without its DataFrame and argument handling"""
+    return go.Figure(
+        go.Choroplethmapbox(
+            geojson=geojson,
+            locations=list(provinces),
+            featureidkey="properties.shapeName",
+            z=[1] * len(provinces),
+            colorscale=[[0, color], [1, color]],
+            showscale=False,
+            marker=dict(opacity=opacity),
+            hovertemplate='Province=%{location}<extra></extra>'
+        ),
+        layout=dict(
+            mapbox=dict(style="carto-positron", zoom=2, center={"lat": 56.130, "lon": -106.347}),
+            margin={"r":0, "t":0, "l":0, "b":0}
+        )
+    )
+
+# Selected-provinces figure, memoized per (selection, clicked) state
+@lru_cache(maxsize=32)
+def build_selected_figure(selected_provinces, clicked_markers):
+    """Blue selected provinces plus their POI markers. Takes sorted tuples so
+    toggling back to an earlier state is served from the cache"""
+    # The shared GeoJSON has every province; locations picks which are drawn
+    provinces = [p for p in selected_provinces if p in features_by_name]
+
+    fig = province_figure(provinces, geojson_url(), "blue", 0.7)
+
+    # Add markers efficiently: one trace for every selected POI
+    pois = poi_df[poi_df['province'].isin(selected_provinces)]
+    if not pois.empty:
+        fig.add_trace(go.Scattermapbox(
+            lat=pois['lat'],
+            lon=pois['lon'],
+            mode='markers',
+            marker=dict(
+                size=10,
+                color=np.where(pois['marker_id'].isin(clicked_markers), 'green', 'red')
+            ),
+            text=pois['place'],
+            customdata=pois[['marker_id']].to_numpy(),
+            hoverinfo='text'
+        ))
+
+    return fig
+
+# Base map with all provinces (light gray), the same for every visitor, so
+# built once as a plain dict
+default_figure = province_figure(provinces_sorted, geojson_url(), "lightgray", 0.5).to_plotly_json()
 
 # ---------------------------
 # Optimized map update
 # ---------------------------
 @app.callback(
     Output('choropleth-map', 'figure'),
-    [Input('province-dropdown', 'value'),
-     Input('clicked-markers', 'data')],
-    State('province-list', 'data')
+    Input('province-dropdown', 'value'),
+    State('clicked-markers', 'data')
 )
-def update_map(selected_provinces, clicked_markers, all_provinces):
+def update_map(selected_provinces, clicked_markers):
     try:
-        # Base map with all provinces (light gray)
         if not selected_provinces:
-            return px.choropleth_mapbox(
-                pd.DataFrame({'Province': all_provinces}),
-                geojson=get_geojson(),
-                locations='Province',
-                featureidkey="properties.shapeName",
-                color_discrete_sequence=["lightgray"],
-                mapbox_style="carto-positron",
-                zoom=2,
-                center={"lat": 56.130, "lon": -106.347},
-                opacity=0.5
-            ).update_layout(margin={"r":0, "t":0, "l":0, "b":0})
-
-        # Load only selected provinces
-        with zipfile.ZipFile('data.zip') as z:
-            with z.open('geoBoundaries-CAN-ADM1_simplified.geojson') as f:
-                geojson = json.load(f)
-                filtered_features = [
-                    feat for feat in geojson['features']
-                    if feat['properties']['shapeName'] in selected_provinces
-                ]
-
-        fig = px.choropleth_mapbox(
-            pd.DataFrame({'Province': selected_provinces}),
-            geojson={"type": "FeatureCollection", "features": filtered_features},
-            locations='Province',
-            featureidkey="properties.shapeName",
-            color_discrete_sequence=["blue"],
-            mapbox_style="carto-positron",
-            zoom=2,
-            center={"lat": 56.130, "lon": -106.347},
-            opacity=0.7
-        )
+            return default_figure
 
-        # Add markers efficiently
-        for province in selected_provinces:
-            for poi in hardcoded_poi_coordinates.get(province, []):
-                fig.add_trace(go.Scattermapbox(
-                    lat=[poi['lat']],
-                    lon=[poi['lon']],
-                    mode='markers',
-                    marker=dict(
-                        size=10,
-                        color='green' if poi['marker_id'] in clicked_markers else 'red'
-                    ),
-                    text=poi['place'],
-                    customdata=[poi['marker_id']],
-                    hoverinfo='text'
-                ))
-
-        return fig.update_layout(margin={"r":0, "t":0, "l":0, "b":0})
+        # Sorted tuples make each (selection, clicked) state one hashable cache key
+        return build_selected_figure(tuple(sorted(selected_provinces)), tuple(sorted(clicked_markers or [])))
 
     except Exception as e:
         print(f"Map error: {e}")
@@ -132,6 +193,33 @@ def update_map(selected_provinces, clicked_markers, all_provinces):
             margin={"r":0, "t":0, "l":0, "b":0}
         )
 
+# ---------------------------
+# Marker recolour on click (runs in the browser)
+# ---------------------------
+# Only the POI trace's colours depend on the clicked markers, so swap that
+# one array in the current figure instead of rebuilding it on the server
+app.clientside_callback(
+    """
+    function(clickedMarkers, figure) {
+        if (!figure || !figure.data || figure.data.length < 2) {
+            return window.dash_clientside.no_update;
+        }
+        const clicked = new Set(clickedMarkers || []);
+        const pois = figure.data[1];
+        const recoloured = Object.assign({}, pois, {
+            marker: Object.assign({}, pois.marker, {
+                color: pois.customdata.map(cd => clicked.has(cd[0]) ? 'green' : 'red')
+            })
+        });
+        return Object.assign({}, figure, {data: [figure.data[0], recoloured]});
+    }
+    """,
+    Output('choropleth-map', 'figure', allow_duplicate=True),
+    Input('clicked-markers', 'data'),
+    State('choropleth-map', 'figure'),
+    prevent_initial_call=True
+)
+
 # ---------------------------
 # Click handler (unchanged)
 # ---------------------------
@@ -145,8 +233,11 @@ def update_clicked_markers(clickData, current_clicked):
         point = clickData['points'][0]
         if 'customdata' in point:
             marker_id = point['customdata'][0]
-            if marker_id not in current_clicked:
-                return current_clicked + [marker_id]
+            clicked = set(current_clicked)
+            if marker_id not in clicked:
+                clicked.add(marker_id)
+                # Sorted so the same set of markers is always stored the same way
+                return sorted(clicked)
     return current_clicked
 
 if __name__ == '__main__':